@@ -2,13 +2,14 @@ import yaml
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Sequence
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import LabelEncoder
 import joblib
 import os
+import re
 import unicodedata
 import pykakasi
 import jaconv
@@ -18,16 +19,22 @@ from sqlalchemy import text
 
 logger = get_logger(__name__)
 
+# テキスト正規化用の正規表現（コンパイル済み）
+NON_ALNUM_RE = re.compile(r'[^a-zA-Z0-9\s]')
+SIX_DIGIT_RE = re.compile(r'\b\d{6}\b')
+MULTI_SPACE_RE = re.compile(r'\s+')
+
 class BankPredictor:
     """
     統合銀行予測器 - 2つのモデル: subject_code予測 + remarks予測
     ルールベースの上書き機能付き
     """
     
-    def __init__(self, config_dir: str = "config", model_dir: str = "models"):
+    def __init__(self, config_dir: str = "config", model_dir: str = "models", train_dir: str = "data/train"):
         self.config_dir = Path(config_dir)
         self.model_dir = Path(model_dir)
         self.model_dir.mkdir(exist_ok=True)
+        self.train_dir = Path(train_dir)
         
         # モデル読���込み（UFJ/JCB用）
         self.models = {}
@@ -207,7 +214,7 @@ class BankPredictor:
         return df
 
     def normalize_text(self, text: str) -> str:
-        """テキスト正規化���全角→半角、日本語→ローマ字"""
+        """テキスト正規化：全角→半角、日本語→ローマ字"""
         if pd.isna(text) or not text:
             return ""
         
@@ -218,23 +225,42 @@ class BankPredictor:
         text = text.replace('　', ' ')
         
         # 日本語をローマ字に変換
-        try:
-            text = self.conv.do(text)
-        except:
-            # 変換失敗時はそのまま
-            pass
+        text = self._romanize(text)
         
-        # 英数字以外の文字を削除し、小文字に変換
-        import re
-        text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text)
+        # 英数字以外の文字を削除
+        text = NON_ALNUM_RE.sub(' ', text)
         
         # 6桁の整数を除去（UFJの取引番号等を除外）
-        text = re.sub(r'\b\d{6}\b', ' ', text)
+        text = SIX_DIGIT_RE.sub(' ', text)
         
-        text = re.sub(r'\s+', ' ', text)  # 複数スペースを1つに
+        text = MULTI_SPACE_RE.sub(' ', text)  # 複数スペースを1つに
         
         return text.lower().strip()
     
+    def normalize_text_series(self, texts: pd.Series) -> pd.Series:
+        """テキスト正規化（Series一括版）
+        
+        ローマ字変換はユニークな値ごとに1回だけ行い、それ以外は文字列メソッドで一括処理する
+        """
+        texts = texts.fillna('').astype(str).str.normalize('NFKC').str.replace('　', ' ', regex=False)
+        
+        # 日本語をローマ字に変換（同じ摘要が繰り返し出現するためユニーク値のみ変換）
+        romanized = {value: self._romanize(value) for value in texts.unique()}
+        texts = texts.map(romanized)
+        
+        texts = texts.str.replace(NON_ALNUM_RE, ' ', regex=True)
+        texts = texts.str.replace(SIX_DIGIT_RE, ' ', regex=True)
+        texts = texts.str.replace(MULTI_SPACE_RE, ' ', regex=True)
+        
+        return texts.str.lower().str.strip()
+    
+    def _romanize(self, text: str) -> str:
+        """日本語をローマ字に変換（失敗時はそのまま）"""
+        try:
+            return self.conv.do(text)
+        except:
+            return text
+    
     def _load_subject_code_model(self, bank: str = 'ufj'):
         """subject_code予測モデル読み込み"""
         model_file = self.model_dir / f'{bank}_subjectcode_model.pkl'
@@ -328,13 +354,75 @@ class BankPredictor:
             return ('Auto classified', 0.0)  # エラー時もデフォルト値を返却
     
     
+    def predict_subject_code_ml_batch(self, texts: Sequence[str], bank: str = 'ufj') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """subject_code機械学習予測（複数テキストを一括推論）
+        
+        Returns:
+            (借方コード配列, 貸方コード配列, 確信度配列)
+        """
+        texts = list(texts)
+        default = (np.full(len(texts), '598', dtype=object), np.full(len(texts), '101', dtype=object), np.zeros(len(texts)))
+        model = self.models.get(bank, {}).get('subject_code')
+        encoder = self.encoders.get(bank, {}).get('subject_code')
+        
+        if not model or not encoder or not texts:
+            return default  # デフォルト: 雑費→UFJ銀行
+        
+        try:
+            prediction_prob = model.predict_proba(texts)
+            predictions = model.predict(texts)
+            
+            max_prob = prediction_prob.max(axis=1)
+            
+            # 予測結果をデコードし、借方・貸方に分割
+            decoded = (pd.Series(encoder.inverse_transform(predictions), dtype=object).astype(str)
+                       .str.split('_', expand=True).reindex(columns=[0, 1, 2]))
+            # '借方_貸方' 形式でないラベルは1件ずつ予測していた時と同様に、その行のみデフォルト値とする
+            valid = (decoded[1].notna() & decoded[2].isna()).to_numpy()
+            if not valid.all():
+                logger.warning(f"subject_code予測ラベルの形式が不正なためデフォルト値を使用します: {int((~valid).sum())}件")
+            return (np.where(valid, decoded[0].to_numpy(dtype=object), '598').astype(object),
+                    np.where(valid, decoded[1].to_numpy(dtype=object), '101').astype(object),
+                    np.where(valid, max_prob, 0.0))
+        except Exception as e:
+            logger.error(f"subject_code予測エラー: {e}")
+            return default  # エラー時もデフォルト値を返却
+    
+    def predict_remarks_ml_batch(self, texts: Sequence[str], bank: str = 'ufj') -> Tuple[np.ndarray, np.ndarray]:
+        """remarks機械学習予測（複数テキストを一括推論）
+        
+        Returns:
+            (備考配列, 確信度配列)
+        """
+        texts = list(texts)
+        default = (np.full(len(texts), 'Auto classified', dtype=object), np.zeros(len(texts)))
+        model = self.models.get(bank, {}).get('remarks')
+        encoder = self.encoders.get(bank, {}).get('remarks')
+        
+        if not model or not encoder or not texts:
+            return default  # デフォルト備考
+        
+        try:
+            prediction_prob = model.predict_proba(texts)
+            predictions = model.predict(texts)
+            
+            max_prob = prediction_prob.max(axis=1)
+            
+            # 予測結果をデコード
+            predicted_remarks = np.asarray(encoder.inverse_transform(predictions), dtype=object)
+            
+            return (predicted_remarks, max_prob)
+        except Exception as e:
+            logger.error(f"remarks予測エラー: {e}")
+            return default  # エラー時もデフォルト値を返却
+    
     def get_training_data(self, target: str = 'subject_code', bank: str = 'ufj') -> pd.DataFrame:
         """学習データをtrainディレクトリから取得
         Args:
             target: 'subject_code' または 'remarks' を指定
             bank: 'ufj' または 'jcb' を指定
         """
-        train_dir = Path("data/train")
+        train_dir = self.train_dir
         training_data = []
         
         # trainディレクトリのCSVファイルを読み込み
@@ -491,7 +579,7 @@ class BankPredictor:
     
     def save_training_data(self, df: pd.DataFrame, filename: str = None, bank: str = 'ufj') -> str:
         """学習データ保存（dateと予測で使った列のみ）"""
-        train_dir = Path("data/train")
+        train_dir = self.train_dir
         train_dir.mkdir(exist_ok=True)
 
         if filename is None:
@@ -1,6 +1,7 @@
 import json
 import os
 import logging
+import pandas as pd
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -28,6 +29,8 @@ with open(CONFIG_DIR / 'codes.json', 'r', encoding='utf-8') as f:
 
 # Convert to the format expected by the application
 SUBJECT_CODES = {int(item['id']): name for name, item in codes_data.items()}
+# Vectorized lookup table (code -> subject name) for pandas Series.map
+SUBJECT_CODES_SERIES = pd.Series(SUBJECT_CODES)
 
 # Balance tolerance for validation
 BALANCE_TOLERANCE = 0.01
@@ -47,27 +47,33 @@ def main():
         check_duplicates = '--no-duplicates' not in sys.argv
 
         logger.info(f"CSV処理を開始します: {file_path}")
-        count = processor.process_csv_for_database(file_path, clear_temp=clear_temp, check_duplicates=check_duplicates)
-        logger.info(f"CSV処理が完了しました: {count}件の仕訳を読み込み")
-        print(f"処理完了: {count}件の仕訳を読み込み")
+        # 読み込み・検証・集計を1つの接続・トランザクションで実行し、最後に1回だけコミット
+        with db_manager.get_connection() as conn:
+            count = processor.process_csv_for_database(file_path, clear_temp=clear_temp, check_duplicates=check_duplicates,
+                                                        conn=conn)
+            logger.info(f"CSV処理が完了しました: {count}件の仕訳を読み込み")
+            print(f"処理完了: {count}件の仕訳を読み込み")
 
-        # セット検証
-        logger.debug("セット検証を開始します")
-        is_valid, message, errors = processor.validate_sets()
-        if is_valid:
-            logger.info(f"検証成功: {message}")
-        else:
-            logger.warning(f"検証で問題が発見されました: {message}")
+            # セット検証
+            logger.debug("セット検証を開始します")
+            is_valid, message, errors = processor.validate_sets(conn=conn)
+            if is_valid:
+                logger.info(f"検証成功: {message}")
+            else:
+                logger.warning(f"検証で問題が発見されました: {message}")
+                if errors is not None:
+                    logger.error(f"不平衡セット詳細: {errors}")
+            print(f"検証結果: {message}")
             if errors is not None:
-                logger.error(f"不平衡セット詳細: {errors}")
-        print(f"検証結果: {message}")
-        if errors is not None:
-            print("不平衡セット:")
-            print(errors)
+                print("不平衡セット:")
+                print(errors)
 
-        if is_valid:
-            print("\n取引集計:")
-            print(processor.get_transaction_summary())
+            if is_valid:
+                print("\n取引集計:")
+                print(processor.get_transaction_summary(conn=conn))
+
+            # 不平衡セットも確認・修正のためtemp_journalに残す（確定処理は検証エラーで中止される）
+            conn.commit()
 
     elif command == 'confirm':
         processor = CSVProcessor()
@@ -1,17 +1,221 @@
+import numpy as np
 import pandas as pd
-import shutil
+import csv
+import io
 from pathlib import Path
-from sqlalchemy import text
-from typing import Tuple, Dict
-from .database import db_manager
+from sqlalchemy import text, bindparam
+from sqlalchemy.engine import Connection
+from contextlib import contextmanager
+from typing import Tuple, Dict, Any, Optional, Iterator, List
+from .database import db_manager, CREATE_MONTHLY_BALANCE_VIEW_SQL, CREATE_MONTHLY_BALANCE_INDEX_SQL
+import errno
 import os
+import re
+import shutil
 import datetime
-from .config import SUBJECT_CODES, PROCESS_DIR, CONFIRMED_DIR, BALANCE_TOLERANCE, get_logger
+from .config import SUBJECT_CODES, SUBJECT_CODES_SERIES, PROCESS_DIR, CONFIRMED_DIR, BALANCE_TOLERANCE, get_logger
 from .bank_predictor import BankPredictor
 from random import randint
 
 logger = get_logger(__name__)
 
+# temp_journalへの一括投入時のチャンクサイズ
+COPY_CHUNKSIZE = 50000
+MULTI_INSERT_CHUNKSIZE = 1000
+# SQLiteの1文あたりのバインド変数上限（3.32未満の既定値。複数行INSERTの行数は列数から算出）
+SQLITE_MAX_VARIABLES = 999
+# 仕訳CSV読み込み時のチャンクサイズ（行数）
+READ_CSV_CHUNKSIZE = 200000
+
+# 仕訳CSVから読み込む列（SetIDは省略可）
+JOURNAL_CSV_COLUMNS = frozenset({'Date', 'SubjectCode', 'Amount', 'Remarks', 'SetID'})
+
+# 型推論を省略できる文字列列（SubjectCode・Amountは空欄や'm'付きの値があるため推論に任せる）
+JOURNAL_CSV_DTYPES = {'Remarks': str, 'SetID': str}
+
+# 文字コード判定に読み込むファイル先頭のバイト数
+CSV_ENCODING_SNIFF_BYTES = 4096
+
+# 日付をパースできない仕訳に割り当てる日付（行を落とすとセットが不平衡になるため除外しない）
+INVALID_DATE_FALLBACK = pd.Timestamp('2000-01-01')
+
+# Amount列から数値以外の文字を除去する正規表現
+AMOUNT_INVALID_CHARS_RE = re.compile(r'[^\d.-]')
+
+# SQL文（モジュール読み込み時に1回だけ生成し、各メソッドで使い回す）
+# 取り込み済みファイルの確認
+SOURCE_FILE_EXISTS_SQL = text("SELECT EXISTS(SELECT 1 FROM temp_journal WHERE source_file = :filename)")
+
+# 一時テーブルクリア
+CLEAR_TEMP_JOURNAL_SQL = text("DELETE FROM temp_journal")
+
+# temp_journalの件数
+COUNT_TEMP_JOURNAL_SQL = text("SELECT COUNT(*) FROM temp_journal")
+
+# 検証キャッシュ用のtemp_journalのフィンガープリント
+# （金額のUPDATEや件数・最大entry_idが変わらない削除＋挿入も検知するため、金額合計と最小entry_idも含める）
+# set_id・dateの書き換えや行間の金額移動は検知できないため、確定前の検証ではキャッシュを使わない
+TEMP_JOURNAL_FINGERPRINT_SQL = text("SELECT COUNT(*), MIN(entry_id), MAX(entry_id), SUM(amount) FROM temp_journal")
+
+# セット検証 1段階目: 平衡チェックのみの軽量な集計
+VALIDATE_SETS_SQL = text("""
+SELECT
+    set_id,
+    date,
+    COUNT(*) as entry_count,
+    SUM(amount) as balance
+FROM temp_journal
+WHERE NOT is_carry_over
+GROUP BY set_id, date
+HAVING ABS(SUM(amount)) > :tolerance
+ORDER BY date, set_id
+""")
+
+# セット検証 2段階目: 不平衡セットのみ仕訳明細を文字列化
+VALIDATE_SETS_DETAIL_SQL = text("""
+SELECT
+    set_id,
+    date,
+    string_agg(DISTINCT remarks, ', ') as remarks_list,
+    string_agg(subject || ':' || amount::text, ', ' ORDER BY amount DESC) as entries
+FROM temp_journal
+WHERE NOT is_carry_over
+  AND set_id IN :set_ids
+GROUP BY set_id, date
+""").bindparams(bindparam('set_ids', expanding=True))
+
+# temp_journal内の重複entry_id削除（最新レコードを保持）
+REMOVE_DUPLICATE_ENTRIES_SQL = text("""
+DELETE FROM temp_journal
+WHERE ctid NOT IN (
+    SELECT MAX(ctid)
+    FROM temp_journal
+    GROUP BY entry_id
+)
+""")
+
+# 仕訳確定: 一時テーブルの仕訳を本テーブルへ移行（既存のentry_idは上書き）
+CONFIRM_ENTRIES_SQL = text("""
+INSERT INTO journal_entries
+    (date, set_id, entry_id, subject_code, amount, remarks, subject, year, month, confirmed_at)
+SELECT date, set_id, entry_id, subject_code, amount, remarks, subject, year, month, CURRENT_TIMESTAMP
+FROM temp_journal
+ON CONFLICT (entry_id) DO UPDATE SET
+    date = EXCLUDED.date,
+    set_id = EXCLUDED.set_id,
+    subject_code = EXCLUDED.subject_code,
+    amount = EXCLUDED.amount,
+    remarks = EXCLUDED.remarks,
+    subject = EXCLUDED.subject,
+    year = EXCLUDED.year,
+    month = EXCLUDED.month,
+    confirmed_at = EXCLUDED.confirmed_at
+""")
+# 移行後の一時テーブルクリア（全行削除のためTRUNCATEを使用）
+TRUNCATE_TEMP_JOURNAL_SQL = text("TRUNCATE temp_journal")
+
+# 月次締切仕訳の登録（executemanyで全科目分を一括実行）
+INSERT_CLOSING_ENTRY_SQL = text("""
+INSERT INTO journal_entries (date, set_id, entry_id, subject_code, amount, remarks, subject, year, month)
+VALUES (:date, :set_id, :entry_id, :code, :amount, :remarks, :subject, :year, :month)
+""")
+
+# 月次残高集計のマテリアライズドビュー
+MONTHLY_BALANCE_EXISTS_SQL = text("SELECT to_regclass('journal_monthly_balance') IS NOT NULL")
+REFRESH_MONTHLY_BALANCE_SQL = text("REFRESH MATERIALIZED VIEW CONCURRENTLY journal_monthly_balance")
+MONTHLY_BALANCE_SQL = text("SELECT year, month, subject_code, amount FROM journal_monthly_balance")
+
+# 取引集計（セット単位）
+TRANSACTION_SUMMARY_SQL = text("""
+SELECT
+    date,
+    set_id,
+    remarks,
+    COUNT(*) as entry_count,
+    string_agg(subject || ':' || amount::text, ', ' ORDER BY amount DESC) as entries
+FROM temp_journal
+GROUP BY date, set_id, remarks
+ORDER BY date, set_id
+""")
+
+# キャッシュフロー分析（現金・預金科目の増減）
+CASHFLOW_SQL = text("""
+SELECT
+    date,
+    set_id,
+    remarks,
+    SUM(CASE WHEN subject_code IN (100, 101, 102) THEN amount ELSE 0 END) as cash_change
+FROM temp_journal
+GROUP BY date, set_id, remarks
+HAVING ABS(SUM(CASE WHEN subject_code IN (100, 101, 102) THEN amount ELSE 0 END)) > 0
+ORDER BY date
+""")
+
+# 試算表ビューから取得する列
+TRIAL_BALANCE_COLUMNS = ['year', 'month', 'subject_code', 'subject', 'debit_total', 'credit_total', 'balance']
+TRIAL_BALANCE_SQL = text(f"SELECT {', '.join(TRIAL_BALANCE_COLUMNS)} FROM trial_balance")
+
+# financial_balance_sheet.csv形式で出力する科目コード
+BALANCE_SHEET_CODES = [
+    100, 101, 102, 109, 111, 130, 200, 220, 280, 290, 300, 400, 490,
+    500, 501, 511, 513, 521, 530, 531, 532, 541, 542, 550, 552, 561,
+    572, 580, 581, 590, 598, 599, 600,
+]
+# 区分別合計の科目コード範囲
+BALANCE_SHEET_TOTAL_RANGES = {
+    'TotalAssets': (100, 199),
+    'TotalLiabilities': (200, 399),
+    'TotalIncome': (400, 499),
+    'TotalExpenses': (500, 599),
+}
+
+
+def psql_copy(table, conn, keys, data_iter) -> None:
+    """to_sql用のmethod: PostgreSQLのCOPY FROM STDINで一括投入する
+
+    Args:
+        table: pandasのSQLTable
+        conn: SQLAlchemyのConnection
+        keys: 列名のリスト
+        data_iter: 行データのイテレータ
+    """
+    dbapi_conn = conn.connection
+    with dbapi_conn.cursor() as cur:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerows(data_iter)
+        buf.seek(0)
+
+        columns = ', '.join(f'"{k}"' for k in keys)
+        table_name = f'{table.schema}.{table.name}' if table.schema else table.name
+        cur.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH CSV", buf)
+
+
+def _zfill(values: np.ndarray, width: int) -> np.ndarray:
+    """文字列配列をwidth桁にゼロ埋め（pandasのstr.zfillと同じくwidth以上の値はそのまま）
+
+    np.char.zfillの結果はwidth文字の配列に切り詰められるため、width未満の値のみ置き換える
+    """
+    return np.where(np.char.str_len(values) < width, np.char.zfill(values, width), values)
+
+
+def bulk_insert_options(conn: Connection, column_count: int) -> Dict[str, Any]:
+    """接続ドライバに応じたto_sqlの投入オプションを返す
+
+    psycopg2ならCOPY、それ以外は複数行INSERTにフォールバックする
+    （SQLiteでは1文のバインド変数が上限を超えないよう、列数から1文あたりの行数を決める）
+
+    Args:
+        conn: 投入に使うDB接続
+        column_count: 投入するDataFrameの列数
+    """
+    if conn.dialect.driver == 'psycopg2':
+        return {'method': psql_copy, 'chunksize': COPY_CHUNKSIZE}
+    if conn.dialect.name == 'sqlite':
+        return {'method': 'multi', 'chunksize': max(1, SQLITE_MAX_VARIABLES // column_count)}
+    return {'method': 'multi', 'chunksize': MULTI_INSERT_CHUNKSIZE}
+
+
 class CSVProcessor:
     """
     統合CSV処理クラス - ファイル処理とデータベース操作を一元化
@@ -21,112 +225,170 @@ class CSVProcessor:
         self.db = db_manager
         # 銀行分類器
         self.bank_predictor = BankPredictor()
+        # validate_setsの結果キャッシュ（temp_journalのフィンガープリントをキーとする）
+        self._validate_cache: Dict[tuple, Tuple[bool, str, pd.DataFrame]] = {}
 
 
-    def process_csv_for_database(self, file_path: str, clear_temp: bool = True, check_duplicates: bool = True) -> int:
+    @contextmanager
+    def _connect(self, conn: Optional[Connection] = None) -> Iterator[Connection]:
+        """DB接続の取得
+        
+        接続が渡された場合はそのまま使用し（トランザクションは呼び出し元が管理）、
+        渡されない場合は新規接続を開いて正常終了時にコミットする
+        
+        Args:
+            conn: 呼び出し元で開いている接続
+            
+        Returns:
+            使用する接続
+        """
+        if conn is not None:
+            yield conn
+            return
+        with self.db.get_connection() as own_conn:
+            yield own_conn
+            own_conn.commit()
+
+    def process_csv_for_database(self, file_path: str, clear_temp: bool = True, check_duplicates: bool = True,
+                                 conn: Optional[Connection] = None) -> int:
         """CSV処理（データベース保存用 - 旧JournalProcessor機能）
         
         Args:
             file_path: 処理対象のCSVファイルパス
             clear_temp: 処理前にtemp_journalテーブルをクリアするか
             check_duplicates: 重複ファイルのチェックを行うか
+            conn: 使用するDB接続（省略時は新規接続を開いてコミット）
             
         Returns:
             処理した行数
         """
-        # ファイル存在確認
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"ファイルが見つかりません: {file_path}")
-        
-        source_filename = Path(file_path).name
+        # ファイル存在確認（stat 1回）と取り込み元ファイル名の取得
+        source_filename = self._source_filename(file_path)
         
-        # 重複チェック
-        if check_duplicates:
-            with self.db.get_connection() as conn:
-                existing_count = pd.read_sql(
-                    text("SELECT COUNT(*) as count FROM temp_journal WHERE source_file = :filename"),
-                    conn,
-                    params={'filename': source_filename}
-                ).iloc[0]['count']
+        with self._connect(conn) as conn:
+            # 重複チェック
+            if check_duplicates:
+                already_loaded = conn.execute(SOURCE_FILE_EXISTS_SQL, {'filename': source_filename}).scalar()
                 
-                if existing_count > 0:
-                    logger.warning(f"ファイル '{source_filename}' は既に処理済みです ({existing_count}行)")
+                if already_loaded:
+                    logger.warning(f"ファイル '{source_filename}' は既に処理済みです")
                     if not clear_temp:
                         logger.info("重複処理をスキップします (clear_temp=Trueで強制処理可能)")
                         return 0
-        
-        # temp_journalテーブルクリア
-        if clear_temp:
-            with self.db.get_connection() as conn:
-                deleted_count = conn.execute(text("DELETE FROM temp_journal")).rowcount
+            
+            # temp_journalテーブルクリア
+            if clear_temp:
+                deleted_count = conn.execute(CLEAR_TEMP_JOURNAL_SQL).rowcount
                 if deleted_count > 0:
                     logger.info(f"temp_journalテーブルをクリアしました ({deleted_count}行削除)")
-        
-        df = pd.read_csv(file_path)
-
-        # データ型変換 - 複数の日付形式に対応
-        def parse_date_flexible(date_str: str) -> pd.Timestamp:
-            """YYYYMMDD形式とYYYY-MM-DD形式の両方に対応した日付パース"""
-            if pd.isna(date_str):
-                return pd.to_datetime("2000-01-01", format='%Y%m%d')
-            
-            date_str = str(date_str).strip()
             
-            # YYYYMMDD形式（8桁）の場合
-            if len(date_str) == 8 and date_str.isdigit():
-                try:
-                    return pd.to_datetime(date_str, format='%Y%m%d')
-                except:
-                    pass
+            # temp_journalが変わるため検証キャッシュを破棄
+            self._validate_cache.clear()
             
-            # YYYY-MM-DD形式やその他の一般的な形式
-            try:
-                return pd.to_datetime(date_str)
-            except:
-                # パースできない場合はNaTを返す
-                return pd.to_datetime("2000-01-01", format='%Y%m%d')
+            # チャンク単位で読み込み→変換→一時テーブルへ投入（PostgreSQLではCOPYで一括投入）
+            row_count = 0
+            entry_offsets: Dict[str, int] = {}
+            # 取り込みに使う列のみをパース（ID列など不要な列は読み飛ばす）
+            with pd.read_csv(file_path, chunksize=READ_CSV_CHUNKSIZE,
+                             usecols=lambda column: column in JOURNAL_CSV_COLUMNS,
+                             dtype=JOURNAL_CSV_DTYPES) as reader:
+                for chunk in reader:
+                    df = self._transform_journal_chunk(chunk, source_filename, entry_offsets)
+                    df.to_sql('temp_journal', conn, if_exists='append', index=False,
+                              **bulk_insert_options(conn, len(df.columns)))
+                    row_count += len(df)
 
-        df['Date'] = df['Date'].apply(parse_date_flexible)
-        
-        # 日付パースに失敗した行をチェック
-        invalid_dates = df[df['Date'].isna()]
-        if len(invalid_dates) > 0:
-            logger.warning(f"{len(invalid_dates)}行の日付をパースできませんでした")
-            logger.debug(f"無効な日付データ: {invalid_dates[['Date']].head().to_string()}")
-            # 無効な日付の行を除外
-            df = df.dropna(subset=['Date'])
+        return row_count
+
+    @staticmethod
+    def _source_filename(file_path: str) -> str:
+        """ファイルの存在を確認し、取り込み元ファイル名を返す
+
+        Raises:
+            FileNotFoundError: ファイルが存在しない場合
+        """
+        path = Path(file_path)
+        if not path.is_file():
+            raise FileNotFoundError(f"ファイルが見つかりません: {file_path}")
+        return path.name
+
+    def _transform_journal_chunk(self, df: pd.DataFrame, source_filename: str, entry_offsets: Dict[str, int]) -> pd.DataFrame:
+        """仕訳CSVのチャンクをtemp_journal形式に変換
         
-        df['Year'] = df['Date'].dt.year
-        df['Month'] = df['Date'].dt.month
+        Args:
+            df: read_csvで読み込んだチャンク
+            source_filename: 取り込み元ファイル名
+            entry_offsets: SetIDごとの既出件数（チャンク間でEntryIDの連番を引き継ぐため更新される）
+            
+        Returns:
+            temp_journal形式のDataFrame
+        """
+        # remarksを全て小文字に変換し、不要な空白を削除（読み込み直後に一度だけ実行）
+        # object型に対しては.str アクセサを2回通すよりリスト内包表記の方が速い
+        df['Remarks'] = pd.Series([value.lower().strip() if isinstance(value, str) else value
+                                   for value in df['Remarks'].to_numpy()],
+                                  index=df.index, dtype=object)
+        # 繰越仕訳フラグ（平衡チェックの除外判定に使用）
+        df['is_carry_over'] = df['Remarks'].str.contains('carry over', regex=False, na=False)
+
+        # データ型変換 - YYYYMMDD形式とYYYY-MM-DD形式の両方に対応（ベクトル化）
+        raw_dates = df['Date']
+        df['Date'] = self._parse_dates(raw_dates)
+        
+        # 日付パースに失敗した行は従来どおり2000-01-01として取り込む
+        invalid_dates = df['Date'].isna()
+        if invalid_dates.any():
+            logger.warning(f"{int(invalid_dates.sum())}行の日付をパースできなかったため"
+                           f"{INVALID_DATE_FALLBACK:%Y-%m-%d}として取り込みます（{source_filename}）")
+            logger.debug(f"無効な日付データ: {raw_dates[invalid_dates].head().to_string()}")
+            df['Date'] = df['Date'].fillna(INVALID_DATE_FALLBACK)
+        
+        # 年・月を月単位のdatetime64から1回の算術演算で算出
+        months_since_epoch = df['Date'].to_numpy(dtype='datetime64[M]').astype('int64')
+        df['Year'] = (1970 + months_since_epoch // 12).astype('int16')
+        df['Month'] = (1 + months_since_epoch % 12).astype('int8')
         
         # Amount列のデータクリーニング
-        # 無効な文字（'m'など）を削除し、数値に変換
-        df['Amount'] = pd.to_numeric(df['Amount'].astype(str).str.replace(r'[^\d.-]', '', regex=True), errors='coerce')
+        # まずそのまま数値変換し、失敗した行のみ無効な文字（'m'など）を削除して再変換
+        amount = pd.to_numeric(df['Amount'], errors='coerce')
+        bad = amount.isna() & df['Amount'].notna()
+        if bad.any():
+            amount.loc[bad] = pd.to_numeric(
+                df.loc[bad, 'Amount'].astype(str).str.replace(AMOUNT_INVALID_CHARS_RE, '', regex=True), errors='coerce'
+            )
         # NaNの場合は0に置換
-        df['Amount'] = df['Amount'].fillna(0)
+        df['Amount'] = amount.fillna(0).astype('float64')
 
-        # SetIDの処理
+        # SetIDの処理（numpyの文字列演算で中間Seriesを作らずに組み立てる）
+        date_prefix = np.char.add(df['Date'].dt.strftime('%Y%m%d').to_numpy(dtype=str), '_')
         if 'SetID' in df.columns:
             # 既存のSetIDを使用し、Date + SetIDの形式に変換
-            df['SetID'] = df['Date'].dt.strftime('%Y%m%d') + '_' + df['SetID'].astype(str).str.zfill(3)
+            set_suffix = df['SetID'].astype(str).to_numpy(dtype=str)
         else:
             # SetIDが存在しない場合は、Remarksから抽出し、失敗した場合はインデックスでフォールバック
-            set_id_from_remarks = df['Remarks'].str.extract(r'(\d+)$')[0].fillna(pd.Series(df.index).astype(str)).str.zfill(3)
-            df['SetID'] = df['Date'].dt.strftime('%Y%m%d') + '_' + set_id_from_remarks
-        
-        # EntryIDの生成（SetID + 連番）
-        df['EntryID'] = df.groupby('SetID').cumcount().astype(str).str.zfill(3)
-        df['EntryID'] = df['SetID'] + '_' + df['EntryID']
+            set_suffix = df['Remarks'].str.extract(r'(\d+)$')[0].fillna(pd.Series(df.index, index=df.index).astype(str)).to_numpy(dtype=str)
+        set_ids = np.char.add(date_prefix, _zfill(set_suffix, 3))
+        df['SetID'] = set_ids
+        
+        # EntryIDの生成（SetID + 連番、前チャンクまでの件数を引き継ぐ）
+        # SetIDで安定ソートし、グループ境界からの位置を整数配列で求める
+        order = np.argsort(set_ids, kind='stable')
+        sorted_sid = set_ids[order]
+        is_group_start = np.ones(len(sorted_sid), dtype=bool)
+        is_group_start[1:] = sorted_sid[1:] != sorted_sid[:-1]
+        group_start = np.flatnonzero(is_group_start)
+        group_size = np.diff(np.r_[group_start, len(sorted_sid)])
+        group_keys = sorted_sid[group_start]
+        group_offset = np.array([entry_offsets.get(key, 0) for key in group_keys], dtype=np.int64)
+        entry_offsets.update(zip(group_keys.tolist(), (group_offset + group_size).tolist()))
 
-        # 科目名の自動変換
-        df['Subject'] = df['SubjectCode'].map(SUBJECT_CODES)
-        df['source_file'] = Path(file_path).name
-        # remarksを全て小文字に変換し、不要な空白を削除
-        df['Remarks'] = df['Remarks'].str.lower()
+        entry_seq = np.empty(len(sorted_sid), dtype=np.int64)
+        entry_seq[order] = np.arange(len(sorted_sid)) - np.repeat(group_start - group_offset, group_size)
+        df['EntryID'] = np.char.add(np.char.add(set_ids, '_'), _zfill(entry_seq.astype(str), 3))
 
-        # 不要な列を削除
-        if 'ID' in df.columns:
-            df = df.drop('ID', axis=1)
+        # 科目名の自動変換
+        df['Subject'] = df['SubjectCode'].map(SUBJECT_CODES_SERIES).astype('category')
+        df['source_file'] = pd.Categorical.from_codes(np.zeros(len(df), dtype='int8'), categories=[source_filename])
 
         # 列名を統一
         df = df.rename(columns={
@@ -140,92 +402,146 @@ class CSVProcessor:
             'Month': 'month',
             'Subject': 'subject'
         })
+        return df
 
-        # 一時テーブルに保存
-        with self.db.get_connection() as conn:
-            df.to_sql('temp_journal', conn, if_exists='append', index=False)
-
-        return len(df)
-
-    def validate_sets(self) -> Tuple[bool, str, pd.DataFrame]:
+    def validate_sets(self, df: Optional[pd.DataFrame] = None, conn: Optional[Connection] = None,
+                      use_cache: bool = True) -> Tuple[bool, str, pd.DataFrame]:
         """セット検証（複式簿記平衡チェック）
         日付とSetIDの組み合わせで平衡をチェック（remarksは関係なし）
         Carry over関連の仕訳は繰越処理のため平衡チェックから除外
         
+        Args:
+            df: 検証対象の仕訳DataFrame（temp_journal形式）。指定時はDBを使わずメモリ上で検証
+            conn: 使用するDB接続（省略時は新規接続）
+            use_cache: temp_journal未変更時に前回の検証結果を返すか（Falseの場合は必ず再集計する）
+            
         Returns:
             検証結果のタプル: (成功/失敗, メッセージ, エラー詳細DataFrame)
         """
-        query = """
-        SELECT
-            set_id,
-            date,
-            COUNT(*) as entry_count,
-            SUM(amount) as balance,
-            string_agg(DISTINCT remarks, ', ') as remarks_list,
-            string_agg(subject || ':' || amount::text, ', ' ORDER BY amount DESC) as entries
-        FROM temp_journal
-        WHERE remarks NOT ILIKE '%carry over%'
-        GROUP BY set_id, date
-        HAVING ABS(SUM(amount)) > :tolerance
-        ORDER BY date, set_id
-        """
+        if df is not None:
+            unbalanced = self._validate_sets_local(df)
+            if len(unbalanced) > 0:
+                return False, f"不平衡なセットが{len(unbalanced)}件あります（Carry over除く）", unbalanced
+            return True, "全セット平衡確認（Carry over除く）", pd.DataFrame()
 
-        with self.db.get_connection() as conn:
-            unbalanced = pd.read_sql(text(query), conn, params={'tolerance': BALANCE_TOLERANCE})
+        with self._connect(conn) as conn:
+            # temp_journalが前回検証時から変わっていなければキャッシュを返す
+            if use_cache:
+                fingerprint = tuple(conn.execute(TEMP_JOURNAL_FINGERPRINT_SQL).fetchone())
+                if fingerprint in self._validate_cache:
+                    logger.debug("セット検証結果をキャッシュから返します")
+                    is_valid, message, errors = self._validate_cache[fingerprint]
+                    # 呼び出し元での変更がキャッシュに波及しないようコピーを返す
+                    return is_valid, message, errors.copy()
+
+            # 平衡チェックのみの軽量な集計を行い、不平衡セットがあれば明細を取得
+            unbalanced = pd.read_sql(VALIDATE_SETS_SQL, conn, params={'tolerance': BALANCE_TOLERANCE})
+            if len(unbalanced) > 0:
+                details = pd.read_sql(VALIDATE_SETS_DETAIL_SQL, conn, params={'set_ids': unbalanced['set_id'].unique().tolist()})
+                unbalanced = unbalanced.merge(
+                    details[['set_id', 'date', 'remarks_list', 'entries']], on=['set_id', 'date'], how='left'
+                )
 
         if len(unbalanced) > 0:
-            return False, f"不平衡なセットが{len(unbalanced)}件あります（Carry over除く）", unbalanced
+            result = (False, f"不平衡なセットが{len(unbalanced)}件あります（Carry over除く）", unbalanced)
         else:
-            return True, "全セット平衡確認（Carry over除く）", pd.DataFrame()
+            result = (True, "全セット平衡確認（Carry over除く）", pd.DataFrame())
+        if use_cache:
+            self._validate_cache = {fingerprint: result}
+        return result[0], result[1], result[2].copy()
 
-    def get_trial_balance(self) -> pd.DataFrame:
+    def _validate_sets_local(self, df: pd.DataFrame) -> pd.DataFrame:
+        """メモリ上の仕訳DataFrameでセット平衡を検証
+        
+        set_id・dateでソートし、np.add.reduceatでセットごとの合計を一括計算する
+        
+        Args:
+            df: 仕訳DataFrame（set_id, date, amount列と、is_carry_overまたはremarks列を含む）
+            
+        Returns:
+            不平衡セットのDataFrame（set_id, date, entry_count, balance）
+        """
+        columns = ['set_id', 'date', 'entry_count', 'balance']
+        if 'is_carry_over' in df.columns:
+            is_carry_over = df['is_carry_over'].astype(bool)
+        else:
+            is_carry_over = df['remarks'].astype(str).str.contains('carry over', case=False, regex=False)
+        target = df[~is_carry_over]
+        if target.empty:
+            return pd.DataFrame(columns=columns)
+
+        set_ids = target['set_id'].to_numpy(dtype=str)
+        dates = target['date'].to_numpy(dtype='datetime64[D]')
+        amounts = target['amount'].to_numpy(dtype='float64')
+
+        order = np.lexsort((set_ids, dates))
+        sorted_sid = set_ids[order]
+        sorted_date = dates[order]
+        is_boundary = (sorted_sid[1:] != sorted_sid[:-1]) | (sorted_date[1:] != sorted_date[:-1])
+        starts = np.r_[0, np.flatnonzero(is_boundary) + 1]
+
+        sums = np.add.reduceat(amounts[order], starts)
+        counts = np.diff(np.r_[starts, len(order)])
+        unbalanced = np.abs(sums) > BALANCE_TOLERANCE
+
+        return pd.DataFrame({
+            'set_id': sorted_sid[starts][unbalanced],
+            'date': sorted_date[starts][unbalanced],
+            'entry_count': counts[unbalanced],
+            'balance': sums[unbalanced],
+        }, columns=columns)
+
+    def get_trial_balance(self, conn: Optional[Connection] = None) -> pd.DataFrame:
         """試算表取得
         
+        Args:
+            conn: 使用するDB接続（省略時は新規接続）
+            
         Returns:
             試算表のDataFrame
         """
-        query = "SELECT * FROM trial_balance"
-        with self.db.get_connection() as conn:
-            return pd.read_sql(text(query), conn)
+        with self._connect(conn) as conn:
+            # DataFrame全体を返すため、チャンク取得＋concatは全チャンクと結合結果を二重に保持するだけになる
+            return pd.read_sql(TRIAL_BALANCE_SQL, conn)
 
-    def get_transaction_summary(self) -> pd.DataFrame:
+    def get_transaction_summary(self, conn: Optional[Connection] = None) -> pd.DataFrame:
         """取引集計（セット単位）
         
+        Args:
+            conn: 使用するDB接続（省略時は新規接続）
+            
         Returns:
             取引集計のDataFrame
         """
-        query = """
-        SELECT
-            date,
-            set_id,
-            remarks,
-            COUNT(*) as entry_count,
-            string_agg(subject || ':' || amount::text, ', ' ORDER BY amount DESC) as entries
-        FROM temp_journal
-        GROUP BY date, set_id, remarks
-        ORDER BY date, set_id
+        with self._connect(conn) as conn:
+            return pd.read_sql(TRANSACTION_SUMMARY_SQL, conn)
+
+    def count_temp_journal(self, conn: Optional[Connection] = None) -> int:
+        """temp_journalの件数取得
+        
+        件数のみが必要な場合に使用し、取引集計のDataFrame生成を避ける
+        
+        Args:
+            conn: 使用するDB接続（省略時は新規接続）
+            
+        Returns:
+            temp_journalの仕訳件数
         """
-        with self.db.get_connection() as conn:
-            return pd.read_sql(text(query), conn)
+        with self._connect(conn) as conn:
+            return conn.execute(COUNT_TEMP_JOURNAL_SQL).scalar()
 
-    def remove_duplicate_entries(self) -> int:
+    def remove_duplicate_entries(self, conn: Optional[Connection] = None) -> int:
         """temp_journal内の重複entry_idを削除
         PostgreSQL用: ctidを使用して最新レコードを保持
         
+        Args:
+            conn: 使用するDB接続（省略時は新規接続を開いてコミット）
+            
         Returns:
             削除した重複レコード数
         """
-        query = """
-        DELETE FROM temp_journal 
-        WHERE ctid NOT IN (
-            SELECT MAX(ctid) 
-            FROM temp_journal 
-            GROUP BY entry_id
-        )
-        """
-        
-        with self.db.get_connection() as conn:
-            result = conn.execute(text(query))
+        with self._connect(conn) as conn:
+            result = conn.execute(REMOVE_DUPLICATE_ENTRIES_SQL)
             deleted_count = result.rowcount
             
             if deleted_count > 0:
@@ -233,131 +549,186 @@ class CSVProcessor:
             
             return deleted_count
 
-    def confirm_entries(self) -> bool:
+    def confirm_entries(self, conn: Optional[Connection] = None) -> bool:
         """仕訳確定
         
+        重複削除・セット検証・移行を1つの接続で実行し、コミット後にCSVファイルを移動する
+        接続が渡された場合はコミットが呼び出し元に委ねられるため、CSVファイルの移動は行わない
+        （コミット後に呼び出し元で _move_confirmed_files を実行する）
+        
+        Args:
+            conn: 使用するDB接続（省略時は新規接続を開いてコミット）
+            
+        Returns:
+            確定処理の成功/失敗
+        """
+        owns_connection = conn is None
+        with self._connect(conn) as conn:
+            if not self._confirm_in_transaction(conn):
+                return False
+
+        # temp_journalがクリアされたため検証キャッシュを破棄
+        self._validate_cache.clear()
+
+        # CSVファイル移動（コミット済みの場合のみ）
+        if owns_connection:
+            self._move_confirmed_files()
+
+        return True
+
+    def _confirm_in_transaction(self, conn: Connection) -> bool:
+        """重複削除・セット検証・本テーブルへの移行をトランザクション内で実行
+        
+        検証エラー時は重複削除を含めてロールバックする（呼び出し元で読み込んだ内容も取り消される）
+        
+        Args:
+            conn: 使用するDB接続（コミットは呼び出し元で行う）
+            
         Returns:
             確定処理の成功/失敗
         """
         # 重複entry_id削除
-        self.remove_duplicate_entries()
+        self.remove_duplicate_entries(conn=conn)
         
-        # セット検証
-        is_valid, message, errors = self.validate_sets()
+        # セット検証（本テーブルへの移行可否の判定のため、キャッシュを使わず必ず再集計する）
+        is_valid, message, errors = self.validate_sets(conn=conn, use_cache=False)
         if not is_valid:
             logger.error(f"セット検証エラー: {message}")
             logger.error(f"エラー詳細: {errors}")
+            conn.rollback()
             return False
 
-        with self.db.get_connection() as conn:
-            # 重複チェック
-            conn.execute(text("DELETE FROM journal_entries WHERE entry_id IN (SELECT entry_id FROM temp_journal)"))
-
-            # 移行
-            conn.execute(text("""
-                INSERT INTO journal_entries
-                SELECT date, set_id, entry_id, subject_code, amount, remarks, subject, year, month, CURRENT_TIMESTAMP
-                FROM temp_journal
-            """))
+        # 本テーブルへ移行（entry_id重複時は上書き）し、一時テーブルをクリア
+        conn.execute(CONFIRM_ENTRIES_SQL)
+        conn.execute(TRUNCATE_TEMP_JOURNAL_SQL)
+        self._refresh_monthly_balance(conn)
+        return True
 
-            # 一時テーブルクリア
-            conn.execute(text("DELETE FROM temp_journal"))
+    def _move_confirmed_files(self, csv_paths: Optional[List[str]] = None) -> int:
+        """process/ディレクトリのCSVファイルをconfirmed/ディレクトリへ移動
+        
+        移動前にファイル一覧を確定させ、同一ファイルシステム内ではos.replaceによる
+        1回のrenameで移動する（別ファイルシステムの場合のみshutil.moveでコピー＋削除）
+        
+        Args:
+            csv_paths: 移動するCSVファイルパス（省略時はprocess/直下の全CSVファイル）
             
-            # 明示的にコミット
-            conn.commit()
+        Returns:
+            移動したファイル数
+        """
+        if csv_paths is None:
+            csv_paths = self._process_dir_csv_paths()
 
-        # CSVファイル移動
-        for file in PROCESS_DIR.glob('*.csv'):
-            shutil.move(str(file), str(CONFIRMED_DIR / file.name))
+        for path in csv_paths:
+            destination = os.path.join(CONFIRMED_DIR, os.path.basename(path))
+            try:
+                os.replace(path, destination)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(path, destination)
+
+        return len(csv_paths)
+
+    @staticmethod
+    def _process_dir_csv_paths() -> List[str]:
+        """process/ディレクトリ直下のCSVファイルパス一覧（os.scandirで1回走査）"""
+        with os.scandir(PROCESS_DIR) as entries:
+            return [entry.path for entry in entries if entry.is_file() and entry.name.endswith('.csv')]
 
+    def _ensure_monthly_balance_view(self, conn: Connection) -> bool:
+        """月次残高集計のマテリアライズドビューがなければ作成
+        
+        init_tablesを再実行していない既存DBでも確定・集計処理が失敗しないようにする
+        
+        Args:
+            conn: 使用するDB接続
+            
+        Returns:
+            ビューを新規作成した場合True（作成時点で集計済み）
+        """
+        if conn.execute(MONTHLY_BALANCE_EXISTS_SQL).scalar():
+            return False
+        logger.info("月次残高集計ビュー journal_monthly_balance が存在しないため作成します")
+        conn.execute(CREATE_MONTHLY_BALANCE_VIEW_SQL)
+        conn.execute(CREATE_MONTHLY_BALANCE_INDEX_SQL)
         return True
 
-    def get_cashflow_analysis(self) -> pd.DataFrame:
+    def _refresh_monthly_balance(self, conn: Connection) -> None:
+        """月次残高集計のマテリアライズドビューをリフレッシュ（未作成の場合は作成のみ）
+        
+        Args:
+            conn: journal_entriesを更新したトランザクション中の接続
+        """
+        if self._ensure_monthly_balance_view(conn):
+            return
+        conn.execute(REFRESH_MONTHLY_BALANCE_SQL)
+
+    def get_cashflow_analysis(self, conn: Optional[Connection] = None) -> pd.DataFrame:
         """キャッシュフロー分析
         
+        Args:
+            conn: 使用するDB接続（省略時は新規接続）
+            
         Returns:
             キャッシュフロー分析のDataFrame
         """
-        query = """
-        SELECT
-            date,
-            set_id,
-            remarks,
-            SUM(CASE WHEN subject_code IN (100, 101, 102) THEN amount ELSE 0 END) as cash_change
-        FROM temp_journal
-        GROUP BY date, set_id, remarks
-        HAVING ABS(SUM(CASE WHEN subject_code IN (100, 101, 102) THEN amount ELSE 0 END)) > 0
-        ORDER BY date
-        """
-        with self.db.get_connection() as conn:
-            return pd.read_sql(text(query), conn)
+        with self._connect(conn) as conn:
+            return pd.read_sql(CASHFLOW_SQL, conn)
 
-    def get_monthly_balance_summary(self) -> pd.DataFrame:
+    def get_monthly_balance_summary(self, conn: Optional[Connection] = None) -> pd.DataFrame:
         """月次残高集計の取得（financial_balance_sheet.csv形式）
         
+        Args:
+            conn: 使用するDB接続（省略時は新規接続）
+            
         Returns:
-            月次残高集計のDataFrame
+            月次残高集計のDataFrame（区分別合計・NetIncome・TotalEquityを含む）
         """
-        query = """
-        SELECT 
-            CONCAT(year, '-', LPAD(month::text, 2, '0')) as YearMonth,
-            SUM(CASE WHEN subject_code = 100 THEN amount ELSE 0 END) as "100",
-            SUM(CASE WHEN subject_code = 101 THEN amount ELSE 0 END) as "101",
-            SUM(CASE WHEN subject_code = 102 THEN amount ELSE 0 END) as "102",
-            SUM(CASE WHEN subject_code = 109 THEN amount ELSE 0 END) as "109",
-            SUM(CASE WHEN subject_code = 111 THEN amount ELSE 0 END) as "111",
-            SUM(CASE WHEN subject_code = 130 THEN amount ELSE 0 END) as "130",
-            SUM(CASE WHEN subject_code = 200 THEN amount ELSE 0 END) as "200",
-            SUM(CASE WHEN subject_code = 220 THEN amount ELSE 0 END) as "220",
-            SUM(CASE WHEN subject_code = 280 THEN amount ELSE 0 END) as "280",
-            SUM(CASE WHEN subject_code = 290 THEN amount ELSE 0 END) as "290",
-            SUM(CASE WHEN subject_code = 300 THEN amount ELSE 0 END) as "300",
-            SUM(CASE WHEN subject_code = 400 THEN amount ELSE 0 END) as "400",
-            SUM(CASE WHEN subject_code = 490 THEN amount ELSE 0 END) as "490",
-            SUM(CASE WHEN subject_code = 500 THEN amount ELSE 0 END) as "500",
-            SUM(CASE WHEN subject_code = 501 THEN amount ELSE 0 END) as "501",
-            SUM(CASE WHEN subject_code = 511 THEN amount ELSE 0 END) as "511",
-            SUM(CASE WHEN subject_code = 513 THEN amount ELSE 0 END) as "513",
-            SUM(CASE WHEN subject_code = 521 THEN amount ELSE 0 END) as "521",
-            SUM(CASE WHEN subject_code = 530 THEN amount ELSE 0 END) as "530",
-            SUM(CASE WHEN subject_code = 531 THEN amount ELSE 0 END) as "531",
-            SUM(CASE WHEN subject_code = 532 THEN amount ELSE 0 END) as "532",
-            SUM(CASE WHEN subject_code = 541 THEN amount ELSE 0 END) as "541",
-            SUM(CASE WHEN subject_code = 542 THEN amount ELSE 0 END) as "542",
-            SUM(CASE WHEN subject_code = 550 THEN amount ELSE 0 END) as "550",
-            SUM(CASE WHEN subject_code = 552 THEN amount ELSE 0 END) as "552",
-            SUM(CASE WHEN subject_code = 561 THEN amount ELSE 0 END) as "561",
-            SUM(CASE WHEN subject_code = 572 THEN amount ELSE 0 END) as "572",
-            SUM(CASE WHEN subject_code = 580 THEN amount ELSE 0 END) as "580",
-            SUM(CASE WHEN subject_code = 581 THEN amount ELSE 0 END) as "581",
-            SUM(CASE WHEN subject_code = 590 THEN amount ELSE 0 END) as "590",
-            SUM(CASE WHEN subject_code = 598 THEN amount ELSE 0 END) as "598",
-            SUM(CASE WHEN subject_code = 599 THEN amount ELSE 0 END) as "599",
-            SUM(CASE WHEN subject_code = 600 THEN amount ELSE 0 END) as "600",
-            SUM(CASE WHEN subject_code BETWEEN 100 AND 199 THEN amount ELSE 0 END) as TotalAssets,
-            SUM(CASE WHEN subject_code BETWEEN 200 AND 399 THEN amount ELSE 0 END) as TotalLiabilities,
-            SUM(CASE WHEN subject_code BETWEEN 400 AND 499 THEN amount ELSE 0 END) as TotalIncome,
-            SUM(CASE WHEN subject_code BETWEEN 500 AND 599 THEN amount ELSE 0 END) as TotalExpenses
-        FROM journal_entries 
-        GROUP BY year, month
-        ORDER BY year, month
-        """
-        with self.db.get_connection() as conn:
-            return pd.read_sql(text(query), conn)
+        # 年月×科目コード単位の集計済みマテリアライズドビューから取得
+        with self._connect(conn) as conn:
+            self._ensure_monthly_balance_view(conn)
+            df = pd.read_sql(MONTHLY_BALANCE_SQL, conn)
+
+        if df.empty:
+            columns = (['YearMonth'] + [str(code) for code in BALANCE_SHEET_CODES]
+                       + list(BALANCE_SHEET_TOTAL_RANGES) + ['NetIncome', 'TotalEquity'])
+            return pd.DataFrame(columns=columns)
 
-    def generate_balance_sheet_format(self) -> pd.DataFrame:
+        # 年月×科目コードの横持ちに変換（ビューで集計済みのため再集計せず、欠損もunstack時に0埋め）
+        wide = df.set_index(['year', 'month', 'subject_code'])['amount'].unstack(fill_value=0).sort_index()
+        wide.columns = wide.columns.astype(int)
+
+        # 区分別合計は全科目コードから算出（インデックス整列を伴わないNumPy配列上で集計）
+        codes = wide.columns.to_numpy()
+        amounts = wide.to_numpy(dtype='float64')
+        totals = {
+            name: amounts[:, (codes >= low) & (codes <= high)].sum(axis=1)
+            for name, (low, high) in BALANCE_SHEET_TOTAL_RANGES.items()
+        }
+        # NetIncomeとTotalEquityも集計済みの区分別合計から同時に算出
+        totals['NetIncome'] = totals['TotalIncome'] + totals['TotalExpenses']
+        totals['TotalEquity'] = totals['TotalAssets'] - totals['TotalLiabilities']
+
+        summary = wide.reindex(columns=BALANCE_SHEET_CODES, fill_value=0.0)
+        summary.columns = [str(code) for code in summary.columns]
+        summary = summary.assign(**totals).reset_index()
+        # 年・月から月単位のPeriodを作り、1回のstrftimeで'YYYY-MM'に整形
+        year_month = pd.PeriodIndex.from_fields(year=summary['year'], month=summary['month'], freq='M')
+        summary.insert(0, 'YearMonth', year_month.strftime('%Y-%m'))
+        return summary.drop(columns=['year', 'month'])
+
+    def generate_balance_sheet_format(self, conn: Optional[Connection] = None) -> pd.DataFrame:
         """financial_balance_sheet.csv形式の出力生成
         
+        Args:
+            conn: 使用するDB接続（省略時は新規接続）
+            
         Returns:
             financial_balance_sheet.csv形式のDataFrame
         """
-        monthly_data = self.get_monthly_balance_summary()
-        
-        # NetIncomeとTotalEquityの計算
-        monthly_data['NetIncome'] = monthly_data['TotalIncome'] + monthly_data['TotalExpenses']
-        monthly_data['TotalEquity'] = monthly_data['TotalAssets'] - monthly_data['TotalLiabilities']
-        
-        return monthly_data
+        # NetIncomeとTotalEquityはget_monthly_balance_summaryで算出済み
+        return self.get_monthly_balance_summary(conn=conn)
 
     def process_bank_csv(self, file_path: str, bank: str, clear_temp: bool = True, check_duplicates: bool = True) -> int:
         """銀行CSV処理（中間CSVファイル生成）
@@ -371,11 +742,8 @@ class CSVProcessor:
         Returns:
             処理した行数
         """
-        # ファイル存在確認
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"ファイルが見つかりません: {file_path}")
-        
-        source_filename = Path(file_path).name
+        # ファイル存在確認（stat 1回）と取り込み元ファイル名の取得
+        source_filename = self._source_filename(file_path)
         
         # CSV処理とファイル保存
         if bank == 'ufj':
@@ -388,38 +756,101 @@ class CSVProcessor:
         logger.info(f"処理完了: {processed_count}行を '{PROCESS_DIR}' にCSVファイルとして保存しました")
         return processed_count
 
-    
-    def _parse_date(self, date_str):
-        """日付パース"""
-        if pd.isna(date_str):
-            return pd.NaT
-        
-        date_str = str(date_str).strip()
+    def process_and_confirm(self, file_path: str, bank: str, clear_temp: bool = True) -> bool:
+        """銀行CSV処理から仕訳確定までを1つの接続・トランザクションで実行
         
-        # YYYYMMDD形式
-        if len(date_str) == 8 and date_str.isdigit():
-            return pd.to_datetime(date_str, format='%Y%m%d', errors='coerce')
+        process_bank_csv → process_csv_for_database → 仕訳確定 を順に実行し、
+        DBへのコミットは最後の1回のみ行う。コミット後に今回生成した中間CSVのみをconfirmed/へ移動する
+        （検証エラー時は読み込みを含めてロールバックし、中間CSVはprocess/に残す）
         
-        # YYYY-MM-DD形式
-        try:
-            return pd.to_datetime(date_str, errors='coerce')
-        except:
-            return pd.NaT
+        Args:
+            file_path: 処理対象の銀行CSVファイルパス
+            bank: 銀行名 ('ufj', 'jcb')
+            clear_temp: 読み込み前にtemp_journalテーブルをクリアするか
+            
+        Returns:
+            確定処理の成功/失敗
+        """
+        # 今回生成された中間CSVのみを読み込むため、処理前のファイル一覧を控える
+        existing_paths = set(self._process_dir_csv_paths())
+        self.process_bank_csv(file_path, bank)
+        new_paths = sorted(set(self._process_dir_csv_paths()) - existing_paths)
+        if not new_paths:
+            logger.warning(f"中間CSVファイルが生成されなかったため確定処理を行いません: {file_path}")
+            return False
+
+        with self._connect() as conn:
+            for i, path in enumerate(new_paths):
+                # 2ファイル目以降は前のファイルの読み込み結果を残す
+                self.process_csv_for_database(path, clear_temp=clear_temp and i == 0, conn=conn)
+            if not self._confirm_in_transaction(conn):
+                return False
+
+        # temp_journalがクリアされたため検証キャッシュを破棄
+        self._validate_cache.clear()
+
+        # コミット後に、今回読み込んだ中間CSVのみを移動
+        self._move_confirmed_files(new_paths)
+        return True
+
+    @staticmethod
+    def _parse_dates(values: pd.Series) -> pd.Series:
+        """日付列をベクトル化してパース（YYYYMMDD形式とその他の形式に対応）
+
+        Args:
+            values: 日付文字列（または数値）のSeries
+
+        Returns:
+            datetime64のSeries（パースできない値はNaT）
+        """
+        date_str = values.astype(str).str.strip()
+        is_yyyymmdd = date_str.str.fullmatch(r'\d{8}')
+        compact_dates = pd.to_datetime(date_str.where(is_yyyymmdd), format='%Y%m%d', errors='coerce')
+        other_dates = pd.to_datetime(date_str.mask(is_yyyymmdd), format='mixed', errors='coerce')
+        return compact_dates.combine_first(other_dates)
     
-    def _process_ufj_csv_to_file(self, file_path: str, source_filename: str) -> int:
-        """UFJ CSVを処理してprocess/ディレクトリにCSVファイルとして保存"""
-        
-        # CSV読み込み
+    @staticmethod
+    def _detect_csv_encoding(file_path: str) -> str:
+        """ファイル先頭のバイト列から文字コードを判定（utf-8-sig / utf-8 / shift_jis）"""
+        with open(file_path, 'rb') as f:
+            head = f.read(CSV_ENCODING_SNIFF_BYTES)
+        if head.startswith(b'\xef\xbb\xbf'):
+            return 'utf-8-sig'
         try:
-            df = pd.read_csv(file_path, encoding='shift_jis')
-            logger.info(f"CSV読み込み完了（shift_jis）: {len(df)}行")
+            head.decode('utf-8')
+            return 'utf-8'
+        except UnicodeDecodeError as e:
+            # 読み込み境界でマルチバイト文字が途切れただけならUTF-8とみなす
+            if e.reason == 'unexpected end of data':
+                return 'utf-8'
+        return 'shift_jis'
+
+    def _read_bank_csv(self, file_path: str) -> Optional[pd.DataFrame]:
+        """銀行・カード明細CSVを判定した文字コードで1回だけ読み込む（失敗時はNone）"""
+        encoding = self._detect_csv_encoding(file_path)
+        try:
+            df = pd.read_csv(file_path, encoding=encoding)
         except UnicodeDecodeError:
+            # 先頭がASCIIのみで判定を誤った場合に限り、もう一方の文字コードで再読込
+            encoding = 'shift_jis' if encoding != 'shift_jis' else 'utf-8'
             try:
-                df = pd.read_csv(file_path, encoding='utf-8')
-                logger.info(f"CSV読み込み完了（utf-8）: {len(df)}行")
+                df = pd.read_csv(file_path, encoding=encoding)
             except Exception as e:
                 logger.error(f"CSV読み込みエラー: {e}")
-                return 0
+                return None
+        except Exception as e:
+            logger.error(f"CSV読み込みエラー: {e}")
+            return None
+        logger.info(f"CSV読み込み完了（{encoding}）: {len(df)}行")
+        return df
+
+    def _process_ufj_csv_to_file(self, file_path: str, source_filename: str) -> int:
+        """UFJ CSVを処理してprocess/ディレクトリにCSVファイルとして保存"""
+        
+        # CSV読み込み
+        df = self._read_bank_csv(file_path)
+        if df is None:
+            return 0
         
         if df.empty:
             logger.warning("CSVファイルが空です")
@@ -454,147 +885,143 @@ class CSVProcessor:
         df_clean = df.copy()
         
         date_col = next((col for col in date_cols if col in df_clean.columns), None)
-        df_clean['date'] = pd.to_datetime(df_clean[date_col], errors='coerce').dt.strftime('%Y-%m-%d') if date_col else '2024-01-01'
+        df_clean['date'] = self._parse_dates(df_clean[date_col]).dt.strftime('%Y-%m-%d') if date_col else '2024-01-01'
         
         df_clean['abstruct'] = df_clean.get('摘要', '').fillna('').astype(str)
         df_clean['memo'] = df_clean.get('摘要内容', '').fillna('').astype(str)
         
-        text_columns = ['abstruct', 'memo']
-        df_clean['combined_text'] = ''
-        for col in text_columns:
-            if col in df_clean.columns:
-                normalized_text = df_clean[col].fillna('').apply(self.bank_predictor.normalize_text)
-                df_clean['combined_text'] += normalized_text + ' '
-        
         df_clean['direction'] = self._determine_direction(df_clean)
-        df_clean['combined_text'] += df_clean['direction'].fillna('') + ' '
+        normalize = self.bank_predictor.normalize_text_series
+        df_clean['combined_text'] = (normalize(df_clean['abstruct']) + ' ' + normalize(df_clean['memo']) + ' '
+                                     + df_clean['direction'].fillna('') + ' ')
         df_clean['amount'] = self._calculate_amount(df_clean)
         
-        # 機械学習予測
-        predictions = []
-        for idx, row in df_clean.iterrows():
-            text = row['combined_text'].strip()
-            
-            subject_result = self.bank_predictor.predict_subject_code_ml(text, bank='ufj')
-            if subject_result[2] > 0.5:
-                debit, credit = subject_result[0], subject_result[1]
-            else:
-                debit, credit = ('598', '101') if row['direction'] == 'out' else ('101', '490')
-            
-            debit = str(int(float(debit))).zfill(3)
-            credit = str(int(float(credit))).zfill(3)
-            
-            remarks_result = self.bank_predictor.predict_remarks_ml(text, bank='ufj')
-            remarks = remarks_result[0] if remarks_result[1] > 0.5 else 'Auto classified'
-            
-            predictions.append({
-                'suggested_debit': debit,
-                'suggested_credit': credit,
-                'remarks_classified': remarks
-            })
+        # 機械学習予測（全行を一括推論）
+        texts = df_clean['combined_text'].str.strip().tolist()
+        sub_debit, sub_credit, sub_conf = self.bank_predictor.predict_subject_code_ml_batch(texts, bank='ufj')
+        rem_pred, rem_conf = self.bank_predictor.predict_remarks_ml_batch(texts, bank='ufj')
+        
+        # 確信度が低い場合は取引方向に応じたデフォルト科目
+        is_out = (df_clean['direction'] == 'out').to_numpy()
+        confident = sub_conf > 0.5
+        debit = np.where(confident, sub_debit, np.where(is_out, '598', '101'))
+        credit = np.where(confident, sub_credit, np.where(is_out, '101', '490'))
         
-        df_predictions = pd.DataFrame(predictions, index=df_clean.index)
-        df_clean = pd.concat([df_clean, df_predictions], axis=1)
+        df_clean['suggested_debit'] = self._format_subject_codes(debit, df_clean.index)
+        df_clean['suggested_credit'] = self._format_subject_codes(credit, df_clean.index)
+        df_clean['remarks_classified'] = np.where(rem_conf > 0.5, rem_pred, 'Auto classified')
 
         # ルール適用
         df_processed = self.bank_predictor.apply_rules(df_clean, 'ufj')
         
         return df_processed
     
+    def _format_subject_codes(self, codes: np.ndarray, index: pd.Index) -> pd.Series:
+        """科目コード（'598', '598.0' など）を3桁の文字列に揃える"""
+        return pd.Series(codes, index=index).astype(float).astype(int).astype(str).str.zfill(3)
+
+    def _parse_amount_column(self, df: pd.DataFrame, column: str) -> pd.Series:
+        """カンマ区切りの金額列を数値に変換（列がない・変換できない場合はNaN）"""
+        if column not in df.columns:
+            return pd.Series(np.nan, index=df.index)
+        cleaned = df[column].astype(str).str.replace(',', '', regex=False).str.strip()
+        return pd.to_numeric(cleaned.where(df[column].notna()), errors='coerce')
+
     def _determine_direction(self, df: pd.DataFrame) -> pd.Series:
         """取引方向判定"""
-        directions = []
-        for _, row in df.iterrows():
-            out_amount = row.get('支払い金額', 0)
-            in_amount = row.get('預かり金額', 0)
-            
-            if pd.notna(out_amount) and str(out_amount).replace(',', '').strip():
-                try:
-                    if float(str(out_amount).replace(',', '')) > 0:
-                        directions.append('out')
-                        continue
-                except: pass
-            
-            if pd.notna(in_amount) and str(in_amount).replace(',', '').strip():
-                try:
-                    if float(str(in_amount).replace(',', '')) > 0:
-                        directions.append('in')
-                        continue
-                except: pass
-            
-            directions.append('unknown')
-        
+        out_amount = self._parse_amount_column(df, '支払い金額')
+        in_amount = self._parse_amount_column(df, '預かり金額')
+        directions = np.where(out_amount.fillna(0) > 0, 'out',
+                              np.where(in_amount.fillna(0) > 0, 'in', 'unknown'))
         return pd.Series(directions, index=df.index)
     
     def _calculate_amount(self, df: pd.DataFrame) -> pd.Series:
-        """金額計算"""
-        amounts = []
-        for _, row in df.iterrows():
-            if '預かり金額' in row and pd.notna(row['預かり金額']) and str(row['預かり金額']).replace(',', '').strip():
-                try:
-                    amounts.append(float(str(row['預かり金額']).replace(',', '')))
-                    continue
-                except ValueError: pass
-            
-            if '支払い金額' in row and pd.notna(row['支払い金額']) and str(row['支払い金額']).replace(',', '').strip():
-                try:
-                    amounts.append(float(str(row['支払い金額']).replace(',', '')))
-                    continue
-                except ValueError: pass
-            
-            amounts.append(0.0)
-        
-        return pd.Series(amounts, index=df.index)
+        """金額計算（預かり金額を優先し、なければ支払い金額）"""
+        out_amount = self._parse_amount_column(df, '支払い金額')
+        in_amount = self._parse_amount_column(df, '預かり金額')
+        return in_amount.combine_first(out_amount).fillna(0.0).astype('float64')
     
     def _convert_to_double_entry(self, df: pd.DataFrame) -> pd.DataFrame:
         """複式簿記形式に変換（ルール適用後のカラムを使用）"""
-        entries = []
-        
-        for idx, row in df.iterrows():
-            amount = row.get('amount', 0)
-            if amount == 0:
-                continue
-                
-            date = row.get('date', '')
-            remarks = row.get('final_remarks', 'classified') 
-            debit_code = row.get('final_debit', '')
-            credit_code = row.get('final_credit', '')
-            
-            # SetIDを日付とインデックスから生成
-            set_id_suffix = str(idx).zfill(3)
-            set_id = f"{pd.to_datetime(date).strftime('%Y%m%d')}_{set_id_suffix}"
-            
-            amount_int = int(round(float(amount)))
-            
-            entries.append({'Date': date, 'SubjectCode': debit_code, 'Amount': amount_int, 'Remarks': remarks, 'SetID': set_id})
-            entries.append({'Date': date, 'SubjectCode': credit_code, 'Amount': -amount_int, 'Remarks': remarks, 'SetID': set_id})
-        
-        return pd.DataFrame(entries)
-    
+        return self._build_double_entries(df, default_debit='', default_credit='')
+
+    def _build_double_entries(self, df: pd.DataFrame, default_debit: str, default_credit: str) -> pd.DataFrame:
+        """明細を借方・貸方の2行ずつの仕訳に列単位で変換（金額0の行は除外）
+
+        Args:
+            df: ルール適用後の明細（date, amount, final_debit, final_credit, final_remarks）
+            default_debit: final_debit列がない場合の借方科目
+            default_credit: final_credit列がない場合の貸方科目
+
+        Returns:
+            Date, SubjectCode, Amount, Remarks, SetID列のDataFrame（借方・貸方の順に交互に並ぶ）
+        """
+        def column(name, default):
+            return df[name] if name in df.columns else pd.Series(default, index=df.index)
+
+        amount = pd.to_numeric(column('amount', 0), errors='coerce')
+        valid = df.loc[(amount != 0).to_numpy()]
+        amount_int = np.round(amount.loc[valid.index].to_numpy(dtype='float64')).astype('int64')
+        dates = column('date', '').loc[valid.index]
+
+        # SetIDを日付とインデックスから生成
+        set_ids = (pd.to_datetime(dates, errors='coerce').dt.strftime('%Y%m%d') + '_'
+                   + pd.Series(valid.index.astype(str), index=valid.index).str.zfill(3))
+
+        # 借方・貸方を交互に並べる（行ごとに [借方, 貸方]）
+        def interleave(debit_values, credit_values):
+            return np.column_stack([np.asarray(debit_values, dtype=object),
+                                    np.asarray(credit_values, dtype=object)]).ravel()
+
+        remarks = column('final_remarks', 'classified').loc[valid.index].to_numpy()
+        return pd.DataFrame({
+            'Date': np.repeat(dates.to_numpy(), 2),
+            'SubjectCode': interleave(column('final_debit', default_debit).loc[valid.index],
+                                      column('final_credit', default_credit).loc[valid.index]),
+            'Amount': np.column_stack([amount_int, -amount_int]).ravel(),
+            'Remarks': np.repeat(remarks, 2),
+            'SetID': np.repeat(set_ids.to_numpy(), 2),
+        })
+
     def _save_entries_to_db(self, df: pd.DataFrame, source_filename: str) -> int:
         """エントリをデータベースに保存"""
         if df.empty:
             return 0
         
         df_db = df.copy()
-        df_db['date'] = pd.to_datetime(df_db['Date']).dt.date
+        # 日付は1回だけパースして日付・年・月に使い回す
+        dates = pd.to_datetime(df_db['Date'])
+        df_db['date'] = dates.dt.date
         df_db['set_id'] = df_db['SetID'].astype(str)
-        df_db['subject_code'] = df_db['SubjectCode'].apply(lambda x: int(float(str(x))))
+        df_db['subject_code'] = pd.to_numeric(df_db['SubjectCode'], errors='coerce').astype('Int64')
         df_db['amount'] = df_db['Amount'].astype(int)
-        df_db['remarks'] = df_db['Remarks']
-        df_db['source_file'] = source_filename
-        df_db['subject'] = df_db['subject_code'].map(SUBJECT_CODES).fillna('Unknown')
-        df_db['year'] = pd.to_datetime(df_db['Date']).dt.year
-        df_db['month'] = pd.to_datetime(df_db['Date']).dt.month
+        # 重複の多い文字列列はカテゴリ型で保持してメモリを削減
+        df_db['remarks'] = df_db['Remarks'].astype('category')
+        df_db['is_carry_over'] = df_db['remarks'].astype(str).str.contains('carry over', case=False, regex=False)
+        df_db['source_file'] = pd.Categorical.from_codes(np.zeros(len(df_db), dtype='int8'), categories=[source_filename])
+        df_db['subject'] = df_db['subject_code'].map(SUBJECT_CODES_SERIES).fillna('Unknown').astype('category')
+        df_db['year'] = dates.dt.year
+        df_db['month'] = dates.dt.month
         
         # set_id ごとに EntryID を生成
-        df_db['entry_id'] = df_db.groupby('set_id').cumcount()
-        df_db['entry_id'] = df_db['set_id'] + '_' + df_db['entry_id'].astype(str).str.zfill(3)
+        set_ids = df_db['set_id'].to_numpy(dtype=str)
+        # 複式変換の出力は同一SetIDが連続するため、連続区間の先頭からの位置を連番とする
+        is_run_start = np.ones(len(set_ids), dtype=bool)
+        is_run_start[1:] = set_ids[1:] != set_ids[:-1]
+        run_start = np.flatnonzero(is_run_start)
+        if pd.Index(set_ids[run_start]).is_unique:
+            run_size = np.diff(np.r_[run_start, len(set_ids)])
+            entry_seq = np.arange(len(set_ids)) - np.repeat(run_start, run_size)
+        else:
+            # 同一SetIDが離れて出現する場合はグループ単位で採番
+            entry_seq = df_db.groupby('set_id', sort=False).cumcount().to_numpy()
+        df_db['entry_id'] = np.char.add(np.char.add(set_ids, '_'), _zfill(entry_seq.astype(str), 3))
 
-        with self.db.get_connection() as conn:
-            df_db[['date', 'set_id', 'entry_id', 'subject_code', 'amount', 'remarks', 'subject', 'year', 'month', 'source_file']].to_sql(
-                'temp_journal', conn, if_exists='append', index=False
-            )
+        df_out = df_db[['date', 'set_id', 'entry_id', 'subject_code', 'amount', 'remarks', 'subject', 'year', 'month', 'source_file', 'is_carry_over']]
+        with self._connect() as conn:
+            df_out.to_sql('temp_journal', conn, if_exists='append', index=False,
+                          **bulk_insert_options(conn, len(df_out.columns)))
+        self._validate_cache.clear()
         
         return len(df_db)
     
@@ -602,16 +1029,9 @@ class CSVProcessor:
         """JCB CSVを処理してprocess/ディレクトリにCSVファイルとして保存"""
         
         # CSV読み込み
-        try:
-            df = pd.read_csv(file_path, encoding='shift_jis')
-            logger.info(f"CSV読み込み完了（shift_jis）: {len(df)}行")
-        except UnicodeDecodeError:
-            try:
-                df = pd.read_csv(file_path, encoding='utf-8')
-                logger.info(f"CSV読み込み完了（utf-8）: {len(df)}行")
-            except Exception as e:
-                logger.error(f"CSV読み込みエラー: {e}")
-                return 0
+        df = self._read_bank_csv(file_path)
+        if df is None:
+            return 0
         
         if df.empty:
             logger.warning("CSVファイルが空です")
@@ -645,47 +1065,30 @@ class CSVProcessor:
         df_clean = df.copy()
         
         date_col = next((col for col in date_cols if col in df_clean.columns), None)
-        df_clean['date'] = pd.to_datetime(df_clean[date_col], errors='coerce').dt.strftime('%Y-%m-%d') if date_col else '2024-01-01'
+        df_clean['date'] = self._parse_dates(df_clean[date_col]).dt.strftime('%Y-%m-%d') if date_col else '2024-01-01'
         
         df_clean['abstruct'] = df_clean.get('ご利用先など', df_clean.get('利用先', '')).fillna('').astype(str)
         df_clean['memo'] = df_clean.get('備考', '').fillna('').astype(str)
         
-        text_columns = ['abstruct', 'memo']
-        df_clean['combined_text'] = ''
-        for col in text_columns:
-            if col in df_clean.columns:
-                normalized_text = df_clean[col].fillna('').apply(self.bank_predictor.normalize_text)
-                df_clean['combined_text'] += normalized_text + ' '
-        
         df_clean['direction'] = 'out'
-        df_clean['combined_text'] += df_clean['direction'] + ' '
+        normalize = self.bank_predictor.normalize_text_series
+        df_clean['combined_text'] = (normalize(df_clean['abstruct']) + ' ' + normalize(df_clean['memo']) + ' '
+                                     + df_clean['direction'] + ' ')
         df_clean['amount'] = self._calculate_jcb_amount(df_clean)
         
-        # 機械学習予測
-        predictions = []
-        for idx, row in df_clean.iterrows():
-            text = row['combined_text'].strip()
-            
-            subject_result = self.bank_predictor.predict_subject_code_ml(text, bank='jcb')
-            if subject_result[2] > 0.5:
-                debit, credit = subject_result[0], subject_result[1]
-            else:
-                debit, credit = '598', '201'
-            
-            debit = str(int(float(debit))).zfill(3)
-            credit = str(int(float(credit))).zfill(3)
-            
-            remarks_result = self.bank_predictor.predict_remarks_ml(text, bank='jcb')
-            remarks = remarks_result[0] if remarks_result[1] > 0.5 else 'JCB Auto classified'
-            
-            predictions.append({
-                'suggested_debit': debit,
-                'suggested_credit': credit,
-                'remarks_classified': remarks
-            })
+        # 機械学習予測（全行を一括推論）
+        texts = df_clean['combined_text'].str.strip().tolist()
+        sub_debit, sub_credit, sub_conf = self.bank_predictor.predict_subject_code_ml_batch(texts, bank='jcb')
+        rem_pred, rem_conf = self.bank_predictor.predict_remarks_ml_batch(texts, bank='jcb')
+        
+        # 確信度が低い場合は雑費→JCB
+        confident = sub_conf > 0.5
+        debit = np.where(confident, sub_debit, '598')
+        credit = np.where(confident, sub_credit, '201')
         
-        df_predictions = pd.DataFrame(predictions, index=df_clean.index)
-        df_clean = pd.concat([df_clean, df_predictions], axis=1)
+        df_clean['suggested_debit'] = self._format_subject_codes(debit, df_clean.index)
+        df_clean['suggested_credit'] = self._format_subject_codes(credit, df_clean.index)
+        df_clean['remarks_classified'] = np.where(rem_conf > 0.5, rem_pred, 'JCB Auto classified')
         
         # ルール適用
         df_processed = self.bank_predictor.apply_rules(df_clean, 'jcb')
@@ -707,28 +1110,7 @@ class CSVProcessor:
     
     def _convert_to_double_entry_jcb(self, df: pd.DataFrame) -> pd.DataFrame:
         """JCB複式簿記形式に変換（ルール適用後のカラムを使用）"""
-        entries = []
-        
-        for idx, row in df.iterrows():
-            amount = row.get('amount', 0)
-            if amount == 0:
-                continue
-                
-            date = row.get('date', '')
-            remarks = row.get('final_remarks', 'classified')
-            debit_code = row.get('final_debit', '598')
-            credit_code = row.get('final_credit', '201')
-            
-            # SetIDを日付とインデックスから生成
-            set_id_suffix = str(idx).zfill(3)
-            set_id = f"{pd.to_datetime(date).strftime('%Y%m%d')}_{set_id_suffix}"
-
-            amount_int = int(round(float(amount)))
-            
-            entries.append({'Date': date, 'SubjectCode': debit_code, 'Amount': amount_int, 'Remarks': remarks, 'SetID': set_id})
-            entries.append({'Date': date, 'SubjectCode': credit_code, 'Amount': -amount_int, 'Remarks': remarks, 'SetID': set_id})
-        
-        return pd.DataFrame(entries)
+        return self._build_double_entries(df, default_debit='598', default_credit='201')
 
     def close_monthly_balance(self, year_month: str, reclose: bool = False):
         """
@@ -796,30 +1178,28 @@ class CSVProcessor:
             # 2. 締切仕訳の作成
             set_id = f'{randint(901, 999)}'
 
+            # 2a. 各損益科目の残高をゼロにする仕訳
+            closing_entries = [{
+                'date': end_date, 'set_id': set_id, 'entry_id': f'{set_id}_{row.subject_code}',
+                'code': row.subject_code, 'amount': -row.balance, 'remarks': 'close',
+                'subject': SUBJECT_CODES.get(int(row.subject_code), 'Unknown'),
+                'year': year, 'month': month
+            } for row in pl_balances]
+
+            # 2b. 純損益を繰越利益に振り替える仕訳
+            if net_income != 0:
+                closing_entries.append({
+                    'date': end_date, 'set_id': set_id, 'entry_id': f'{set_id}_{RETAINED_EARNINGS_CODE}',
+                    'code': RETAINED_EARNINGS_CODE, 'amount': net_income, 'remarks': 'loss and benefit',
+                    'subject': SUBJECT_CODES.get(int(RETAINED_EARNINGS_CODE), 'Unknown'),
+                    'year': year, 'month': month
+                })
+
             try:
-                # 2a. 各損益科目の残高をゼロにする仕訳
-                for row in pl_balances:
-                    conn.execute(text("""
-                        INSERT INTO journal_entries (date, set_id, entry_id, subject_code, amount, remarks, subject, year, month)
-                        VALUES (:date, :set_id, :entry_id, :code, :amount, :remarks, :subject, :year, :month)
-                    """), {
-                        'date': end_date, 'set_id': set_id, 'entry_id': f'{set_id}_{row.subject_code}',
-                        'code': row.subject_code, 'amount': -row.balance, 'remarks': 'close', 
-                        'subject': SUBJECT_CODES.get(int(row.subject_code), 'Unknown'),
-                        'year': year, 'month': month
-                    })
-
-                # 2b. 純損益を繰越利益に振り替える仕訳
-                if net_income != 0:
-                    conn.execute(text("""
-                        INSERT INTO journal_entries (date, set_id, entry_id, subject_code, amount, remarks, subject, year, month)
-                        VALUES (:date, :set_id, :entry_id, :code, :amount, :remarks, :subject, :year, :month)
-                    """), {
-                        'date': end_date, 'set_id': set_id, 'entry_id': f'{set_id}_{RETAINED_EARNINGS_CODE}',
-                        'code': RETAINED_EARNINGS_CODE, 'amount': net_income, 'remarks': 'loss and benefit',
-                        'subject': SUBJECT_CODES.get(int(RETAINED_EARNINGS_CODE), 'Unknown'),
-                        'year': year, 'month': month
-                    })
+                # 締切仕訳をexecutemanyで一括登録
+                conn.execute(INSERT_CLOSING_ENTRY_SQL, closing_entries)
+
+                self._refresh_monthly_balance(conn)
                 
                 # 明示的にコミット
                 conn.commit()
@@ -845,21 +1225,4 @@ class CSVProcessor:
         
         logger.info(f"分類結果をCSVファイルとして保存しました: {output_path} ({len(df)}行)")
         return len(df)
-
-    def _parse_date(self, date_str):
-        """日付パース"""
-        if pd.isna(date_str):
-            return pd.NaT
-        
-        date_str = str(date_str).strip()
-        
-        # YYYYMMDD形式
-        if len(date_str) == 8 and date_str.isdigit():
-            return pd.to_datetime(date_str, format='%Y%m%d', errors='coerce')
-        
-        # YYYY-MM-DD形式
-        try:
-            return pd.to_datetime(date_str, errors='coerce')
-        except:
-            return pd.NaT
     
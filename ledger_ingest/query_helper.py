@@ -5,9 +5,12 @@ confirmコマンド実行前後のデータ状況確認用
 """
 
 import sys
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator, Optional
 import pandas as pd
 from sqlalchemy import text
+from sqlalchemy.engine import Connection
 from .database import db_manager
 from .config import BALANCE_TOLERANCE, get_logger
 
@@ -18,6 +21,31 @@ class QueryHelper:
     
     def __init__(self):
         self.db = db_manager
+        self._shared_conn: Optional[Connection] = None
+    
+    @contextmanager
+    def shared_connection(self) -> Iterator[Connection]:
+        """ブロック内の各表示メソッドで1つの接続を共有する（複数の表示をまとめて実行する場合に使用）"""
+        with self.db.get_connection() as conn:
+            self._shared_conn = conn
+            try:
+                yield conn
+            finally:
+                self._shared_conn = None
+    
+    @contextmanager
+    def _connect(self) -> Iterator[Connection]:
+        """共有接続があればそれを使い、なければ新規接続を開く"""
+        if self._shared_conn is None:
+            with self.db.get_connection() as conn:
+                yield conn
+            return
+        try:
+            yield self._shared_conn
+        except Exception:
+            # 失敗したクエリでトランザクションが中断されるため、後続の表示のためにロールバック
+            self._shared_conn.rollback()
+            raise
     
     def show_table_summary(self):
         """テーブル概要表示"""
@@ -49,7 +77,7 @@ class QueryHelper:
         
         try:
             logger.debug("テーブル概要クエリを実行します")
-            with self.db.get_connection() as conn:
+            with self._connect() as conn:
                 result = pd.read_sql(text(query), conn)
                 print(result.to_string(index=False))
                 logger.debug("テーブル概要表示が完了しました")
@@ -74,7 +102,7 @@ class QueryHelper:
         ORDER BY t.date, t.set_id, t.entry_id
         """
         
-        with self.db.get_connection() as conn:
+        with self._connect() as conn:
             result = pd.read_sql(text(query), conn)
             
             if len(result) == 0:
@@ -107,12 +135,12 @@ class QueryHelper:
                 ELSE '不平衡'
             END as status
         FROM temp_journal
-        WHERE remarks NOT ILIKE '%carry over%'
+        WHERE NOT is_carry_over
         GROUP BY set_id, date
         ORDER BY date, set_id
         """
         
-        with self.db.get_connection() as conn:
+        with self._connect() as conn:
             result = pd.read_sql(text(query), conn, params={'tolerance': BALANCE_TOLERANCE})
             
             if len(result) == 0:
@@ -151,7 +179,7 @@ class QueryHelper:
         ORDER BY date, set_id
         """
         
-        with self.db.get_connection() as conn:
+        with self._connect() as conn:
             result = pd.read_sql(text(query), conn, params={'tolerance': BALANCE_TOLERANCE})
             
             if len(result) == 0:
@@ -164,7 +192,7 @@ class QueryHelper:
         """最近の確定処理結果"""
         print(f"\n=== 最近{days}日間の確定処理 ===")
         
-        query = f"""
+        query = """
         SELECT 
             date,
             set_id,
@@ -173,13 +201,13 @@ class QueryHelper:
             string_agg(subject_code::text || ':' || amount::text, ', ') as entries,
             confirmed_at::date as confirmed_date
         FROM journal_entries 
-        WHERE confirmed_at >= CURRENT_DATE - INTERVAL '{days} day'
+        WHERE confirmed_at >= CURRENT_DATE - make_interval(days => :days)
         GROUP BY date, set_id, confirmed_at::date
         ORDER BY confirmed_at::date DESC, date, set_id
         """
         
-        with self.db.get_connection() as conn:
-            result = pd.read_sql(text(query), conn)
+        with self._connect() as conn:
+            result = pd.read_sql(text(query), conn, params={'days': int(days)})
             
             if len(result) == 0:
                 print(f"過去{days}日間に確定された仕訳はありません")
@@ -203,7 +231,7 @@ class QueryHelper:
         ORDER BY source_file
         """
         
-        with self.db.get_connection() as conn:
+        with self._connect() as conn:
             temp_files = pd.read_sql(text(query_temp), conn)
             
             if len(temp_files) > 0:
@@ -228,7 +256,7 @@ FROM temp_journal;""")
         print("DELETE FROM temp_journal;")
         
         # 影響行数の予測
-        with self.db.get_connection() as conn:
+        with self._connect() as conn:
             # 重複削除対象
             duplicate_query = """
             SELECT COUNT(*) as count 
@@ -269,7 +297,7 @@ FROM temp_journal;""")
         ORDER BY subject_code
         """
         
-        with self.db.get_connection() as conn:
+        with self._connect() as conn:
             balances = pd.read_sql(text(balance_query), conn)
             
             if len(balances) == 0:
@@ -331,7 +359,7 @@ FROM temp_journal;""")
         ORDER BY year, month
         """ % months
         
-        with self.db.get_connection() as conn:
+        with self._connect() as conn:
             trend = pd.read_sql(text(trend_query), conn)
             
             if len(trend) == 0:
@@ -427,7 +455,7 @@ FROM temp_journal;""")
         print(f"Query: {query_str}")
         
         try:
-            with self.db.get_connection() as conn:
+            with self._connect() as conn:
                 df = pd.read_sql(text(query_str), conn, params=params)
                 if df.empty:
                     print("データが見つかりません。")
@@ -468,8 +496,9 @@ def main():
     elif command == 'duplicates':
         helper.check_duplicates()
     elif command == 'balance':
-        helper.check_balance_temp()
-        helper.check_balance_confirmed()
+        with helper.shared_connection():
+            helper.check_balance_temp()
+            helper.check_balance_confirmed()
     elif command == 'recent':
         days = int(args[1]) if len(args) > 1 and args[1].isdigit() else 7
         helper.show_recent_confirmations(days)
@@ -493,16 +522,18 @@ def main():
         options = args[2:]
         helper.check_data(target, options)
     elif command == 'all':
-        helper.show_table_summary()
-        helper.check_duplicates()
-        helper.check_balance_temp()
-        helper.check_balance_confirmed()
-        helper.show_recent_confirmations()
-        helper.show_source_files()
-        helper.show_sql_preview()
-        helper.show_financial_status()
-        helper.show_monthly_trend()
-        helper.show_closing_status()
+        # すべての表示で1つの接続を使い回す
+        with helper.shared_connection():
+            helper.show_table_summary()
+            helper.check_duplicates()
+            helper.check_balance_temp()
+            helper.check_balance_confirmed()
+            helper.show_recent_confirmations()
+            helper.show_source_files()
+            helper.show_sql_preview()
+            helper.show_financial_status()
+            helper.show_monthly_trend()
+            helper.show_closing_status()
     else:
         print(f"無効なコマンド: {command}")
         print("使用可能なコマンド: summary, duplicates, balance, recent, files, preview, status, trend, closing, check, all")
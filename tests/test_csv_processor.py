@@ -1,21 +1,25 @@
 import pytest
 import pandas as pd
+import numpy as np
 import tempfile
+import errno
+import io
 import os
 from pathlib import Path
 from unittest.mock import Mock, patch, MagicMock
-import sys
+from sqlalchemy import create_engine, text
 
-sys.path.append(str(Path(__file__).parent.parent))
+from ledger_ingest.processor import CSVProcessor, JOURNAL_CSV_COLUMNS, JOURNAL_CSV_DTYPES, bulk_insert_options, psql_copy
+from ledger_ingest.database import DatabaseManager, CREATE_TEMP_JOURNAL_SQL
 
-from ledger_ingest.processor import CSVProcessor
-from ledger_ingest.database import DatabaseManager
+# リポジトリ直下のdata/ディレクトリ
+DATA_DIR = Path(__file__).parent.parent / 'data'
 
 
 class TestCSVProcessor:
     """CSVProcessor統合テストクラス"""
     
-    @pytest.fixture
+    @pytest.fixture(scope='session')
     def sample_csv_data(self):
         """テスト用CSVデータ"""
         return """Date,ID,SubjectCode,Amount,Remarks,SetID
@@ -29,14 +33,18 @@ class TestCSVProcessor:
                     2024-03-02,,101,-1850,PayPay,02
                     2024-03-02,,500,1850,PayPay,02"""
 
-    @pytest.fixture
-    def temp_csv_file(self, sample_csv_data):
-        """一時CSVファイル作成"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            f.write(sample_csv_data)
-            f.flush()
-            yield f.name
-        os.unlink(f.name)
+    @pytest.fixture(scope='session')
+    def temp_csv_file(self, sample_csv_data, tmp_path_factory):
+        """一時CSVファイル作成（読み取り専用のためセッション内で共有）"""
+        path = tmp_path_factory.mktemp('csv') / 'sample.csv'
+        path.write_text(sample_csv_data)
+        return str(path)
+
+    @pytest.fixture(scope='session')
+    def sample_df(self, sample_csv_data):
+        """パース済みのサンプル仕訳（取り込み時と同じ列・型で読み込み）"""
+        return pd.read_csv(io.StringIO(sample_csv_data), usecols=lambda column: column in JOURNAL_CSV_COLUMNS,
+                           dtype=JOURNAL_CSV_DTYPES)
 
     @pytest.fixture
     def mock_db_manager(self):
@@ -49,6 +57,23 @@ class TestCSVProcessor:
         mock_db.get_connection.return_value = mock_context_manager
         return mock_db
 
+    @pytest.fixture
+    def real_db(self):
+        """temp_journalを持つインメモリSQLiteエンジン"""
+        engine = create_engine('sqlite:///:memory:')
+        with engine.begin() as conn:
+            conn.execute(CREATE_TEMP_JOURNAL_SQL)
+        yield engine
+        engine.dispose()
+
+    @pytest.fixture
+    def real_processor(self, real_db):
+        """実際のSQLiteに接続するCSVProcessor インスタンス"""
+        processor = CSVProcessor()
+        processor.db = Mock(spec=DatabaseManager)
+        processor.db.get_connection.side_effect = real_db.connect
+        return processor
+
     @pytest.fixture
     def processor(self, mock_db_manager):
         """CSVProcessor インスタンス"""
@@ -68,30 +93,109 @@ class TestCSVProcessor:
         processor_custom.db = custom_db
         assert processor_custom.db == custom_db
 
-    def test_process_csv_for_database_basic(self, processor, temp_csv_file, mock_db_manager):
-        """基本的なCSV処理テスト"""
+    def test_process_csv_for_database_basic(self, real_processor, real_db, temp_csv_file):
+        """基本的なCSV処理テスト（SQLiteへ実際に投入して確認）"""
+        original_to_sql = pd.DataFrame.to_sql
+        to_sql_calls = []
+        
+        def spy_to_sql(self, *args, **kwargs):
+            to_sql_calls.append((len(self.columns), kwargs))
+            return original_to_sql(self, *args, **kwargs)
+        
+        with patch('pandas.DataFrame.to_sql', spy_to_sql):
+            result = real_processor.process_csv_for_database(temp_csv_file)
+        
+        # 処理行数の確認
+        assert result == 9
+        
+        # SQLiteでは複数行INSERTにフォールバックし、1文のバインド変数が999以下になる行数で投入
+        (column_count, kwargs), = to_sql_calls
+        assert kwargs['method'] == 'multi'
+        assert kwargs['chunksize'] == 999 // column_count
+        assert kwargs['chunksize'] * column_count <= 999
+        
+        # temp_journalに投入された内容を読み戻して確認
+        with real_db.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT set_id, entry_id, subject_code, source_file FROM temp_journal ORDER BY entry_id"
+            )).fetchall()
+        
+        assert len(rows) == 9
+        assert {row.source_file for row in rows} == {'sample.csv'}
+        assert len({row.entry_id for row in rows}) == 9
+        assert {row.set_id for row in rows} == {'20240301_099', '20240302_001', '20240302_002'}
+
+    def test_count_temp_journal(self, real_processor, temp_csv_file):
+        """temp_journal件数取得のテスト"""
+        assert real_processor.count_temp_journal() == 0
+        
+        real_processor.process_csv_for_database(temp_csv_file)
+        
+        assert real_processor.count_temp_journal() == 9
+
+    def test_process_csv_for_database_skips_loaded_file(self, processor, temp_csv_file, mock_db_manager):
+        """処理済みファイルのスキップテスト（clear_temp=False）"""
+        mock_connection = mock_db_manager.get_connection.return_value.__enter__.return_value
+        mock_connection.execute.return_value.scalar.return_value = True
+        
         with patch('pandas.DataFrame.to_sql') as mock_to_sql:
-            with patch('pandas.read_sql') as mock_read_sql:
-                # 重複チェックのモック（重複なし）
-                mock_read_sql.return_value = pd.DataFrame({'count': [0]})
-                
-                # conn.execute().rowcountのモック
-                mock_execute_result = MagicMock()
-                mock_execute_result.rowcount = 0
-                mock_db_manager.get_connection.return_value.__enter__.return_value.execute.return_value = mock_execute_result
-                
-                result = processor.process_csv_for_database(temp_csv_file)
-                
-                # 処理行数の確認
-                assert result == 9
-                
-                # データベース保存が呼ばれたことを確認
-                mock_to_sql.assert_called_once_with(
-                    'temp_journal', 
-                    mock_db_manager.get_connection.return_value.__enter__.return_value,
-                    if_exists='append', 
-                    index=False
-                )
+            result = processor.process_csv_for_database(temp_csv_file, clear_temp=False)
+        
+        assert result == 0
+        mock_to_sql.assert_not_called()
+        assert 'EXISTS' in str(mock_connection.execute.call_args[0][0])
+
+    def test_process_csv_for_database_with_shared_connection(self, processor, temp_csv_file, mock_db_manager):
+        """呼び出し元の接続を使う場合は新規接続・コミットを行わないことのテスト"""
+        shared_conn = MagicMock()
+        shared_conn.execute.return_value.scalar.return_value = False
+        shared_conn.execute.return_value.rowcount = 0
+        
+        with patch('pandas.DataFrame.to_sql') as mock_to_sql:
+            result = processor.process_csv_for_database(temp_csv_file, conn=shared_conn)
+        
+        assert result == 9
+        assert mock_to_sql.call_args[0][1] is shared_conn
+        mock_db_manager.get_connection.assert_not_called()
+        shared_conn.commit.assert_not_called()
+
+    def test_bulk_insert_options_uses_copy_for_psycopg2(self):
+        """psycopg2接続ではCOPYで一括投入するテスト"""
+        mock_conn = MagicMock()
+        mock_conn.dialect.driver = 'psycopg2'
+
+        options = bulk_insert_options(mock_conn, 11)
+
+        assert options['method'] is psql_copy
+        assert options['chunksize'] == 50000
+
+    def test_bulk_insert_options_multi_insert_fallback(self):
+        """psycopg2以外では複数行INSERTにフォールバックし、SQLiteでは列数から行数を決めるテスト"""
+        mock_conn = MagicMock()
+        mock_conn.dialect.driver = 'pysqlite'
+        mock_conn.dialect.name = 'sqlite'
+
+        assert bulk_insert_options(mock_conn, 11) == {'method': 'multi', 'chunksize': 90}
+        assert bulk_insert_options(mock_conn, 1000) == {'method': 'multi', 'chunksize': 1}
+
+        mock_conn.dialect.driver = 'psycopg'
+        mock_conn.dialect.name = 'postgresql'
+
+        assert bulk_insert_options(mock_conn, 11) == {'method': 'multi', 'chunksize': 1000}
+
+    def test_psql_copy(self):
+        """COPY FROM STDINでCSVバッファが送られることのテスト"""
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.connection.cursor.return_value.__enter__.return_value
+        mock_table = MagicMock()
+        mock_table.schema = None
+        mock_table.name = 'temp_journal'
+
+        psql_copy(mock_table, mock_conn, ['date', 'amount'], iter([('2024-03-01', 100), ('2024-03-02', -100)]))
+
+        sql, buf = mock_cursor.copy_expert.call_args[0]
+        assert sql == 'COPY temp_journal ("date", "amount") FROM STDIN WITH CSV'
+        assert buf.getvalue().splitlines() == ['2024-03-01,100', '2024-03-02,-100']
 
     def test_process_csv_for_database_data_transformation(self, processor, temp_csv_file):
         """CSV処理時のデータ変換テスト"""
@@ -100,19 +204,21 @@ class TestCSVProcessor:
         
         def capture_df(self, *args, **kwargs):
             nonlocal captured_df
-            captured_df = self.copy()
+            # 投入後のチャンクはprocessor側で再利用されないため、コピーせず参照を保持する
+            captured_df = self
             return original_to_sql(self, *args, **kwargs)
         
         with patch('pandas.DataFrame.to_sql', capture_df):
-            with patch('pandas.read_sql') as mock_read_sql:
-                # 重複チェックのモック（重複なし）
-                mock_read_sql.return_value = pd.DataFrame({'count': [0]})
-                with patch.object(processor.db, 'get_connection') as mock_get_conn:
-                    # connectionオブジェクトのモック設定
-                    mock_conn = mock_get_conn.return_value.__enter__.return_value
-                    mock_result = mock_conn.execute.return_value
-                    mock_result.rowcount = 0  # rowcountを整数値に設定
-                    processor.process_csv_for_database(temp_csv_file)
+            with patch.object(processor.db, 'get_connection') as mock_get_conn:
+                # connectionオブジェクトのモック設定
+                mock_conn = mock_get_conn.return_value.__enter__.return_value
+                mock_result = mock_conn.execute.return_value
+                mock_result.scalar.return_value = False  # 重複チェック（EXISTS）は未処理
+                mock_result.rowcount = 0  # rowcountを整数値に設定
+                processor.process_csv_for_database(temp_csv_file)
+        
+        # 重複チェックはread_sqlではなく1回のEXISTSクエリで行う
+        assert 'EXISTS' in str(mock_conn.execute.call_args_list[0].args[0])
         
         # データ変換の確認
         assert captured_df is not None
@@ -123,6 +229,9 @@ class TestCSVProcessor:
         assert 'month' in captured_df.columns
         assert 'subject' in captured_df.columns
         
+        # 繰越仕訳フラグの確認（サンプルの先頭5行がCarry over）
+        assert captured_df['is_carry_over'].tolist() == [True] * 5 + [False] * 4
+        
         # SetIDとEntryIDの生成確認（3桁）
         assert captured_df['set_id'].notna().all()
         assert captured_df['entry_id'].notna().all()
@@ -151,14 +260,19 @@ class TestCSVProcessor:
         unbalanced_data = pd.DataFrame({
             'set_id': ['T001'],
             'date': ['2024-03-01'],
-            'remarks': ['Test'],
             'entry_count': [2],
-            'balance': [100],  # 不平衡
+            'balance': [100]  # 不平衡
+        })
+        # 不平衡セットの明細（2段階目のクエリ）
+        detail_data = pd.DataFrame({
+            'set_id': ['T001'],
+            'date': ['2024-03-01'],
+            'remarks_list': ['Test'],
             'entries': ['現金:100, 食費:-50']
         })
         
         with patch('pandas.read_sql') as mock_read_sql:
-            mock_read_sql.return_value = unbalanced_data
+            mock_read_sql.side_effect = [unbalanced_data, detail_data]
             
             is_valid, message, errors = processor.validate_sets()
             
@@ -166,6 +280,59 @@ class TestCSVProcessor:
             assert "不平衡なセットが1件あります" in message
             assert errors is not None
             assert len(errors) == 1
+            assert errors.loc[0, 'entries'] == '現金:100, 食費:-50'
+            assert mock_read_sql.call_args.kwargs['params'] == {'set_ids': ['T001']}
+
+    def test_validate_sets_cached(self, processor, mock_db_manager):
+        """temp_journal未変更時のセット検証キャッシュテスト"""
+        mock_connection = mock_db_manager.get_connection.return_value.__enter__.return_value
+        mock_connection.execute.return_value.fetchone.return_value = (4, '20240301_099_000', '20240302_002_001', 0.0)
+        
+        with patch('pandas.read_sql') as mock_read_sql:
+            mock_read_sql.return_value = pd.DataFrame()
+            
+            first = processor.validate_sets()
+            second = processor.validate_sets()
+            assert first[:2] == second[:2]
+            # エラー詳細は呼び出しごとに別オブジェクト（キャッシュを直接渡さない）
+            assert first[2] is not second[2]
+            mock_read_sql.assert_called_once()
+            
+            # 件数が変わった場合は再検証
+            mock_connection.execute.return_value.fetchone.return_value = (6, '20240301_099_000', '20240302_002_001', 0.0)
+            processor.validate_sets()
+            assert mock_read_sql.call_count == 2
+            
+            # 件数・entry_idが同じでも金額が変わった場合（UPDATE）は再検証
+            mock_connection.execute.return_value.fetchone.return_value = (6, '20240301_099_000', '20240302_002_001', 500.0)
+            processor.validate_sets()
+            assert mock_read_sql.call_count == 3
+            
+            # フィンガープリントが同じでもuse_cache=Falseなら再集計する（確定前の検証）
+            processor.validate_sets(use_cache=False)
+            assert mock_read_sql.call_count == 4
+
+    def test_validate_sets_local(self, processor, mock_db_manager):
+        """メモリ上のDataFrameでのセット検証テスト（DB未使用）"""
+        df = pd.DataFrame({
+            'set_id': ['20240301_099', '20240301_099', '20240302_001', '20240302_001', '20240302_002', '20240302_002'],
+            'date': pd.to_datetime(['2024-03-01', '2024-03-01', '2024-03-02', '2024-03-02', '2024-03-02', '2024-03-02']),
+            'amount': [-44881, 0, -850, 850, -1850, 1800],
+            'remarks': ['carry over', 'carry over', 'shogo', 'shogo', 'paypay', 'paypay']
+        })
+        
+        is_valid, message, errors = processor.validate_sets(df)
+        
+        assert is_valid == False
+        assert "不平衡なセットが1件あります" in message
+        assert errors['set_id'].tolist() == ['20240302_002']
+        assert errors['entry_count'].tolist() == [2]
+        assert errors['balance'].tolist() == [-50]
+        mock_db_manager.get_connection.assert_not_called()
+        
+        is_valid, _, errors = processor.validate_sets(df[df['set_id'] != '20240302_002'])
+        assert is_valid == True
+        assert len(errors) == 0
 
     def test_get_trial_balance(self, processor, mock_db_manager):
         """試算表取得テスト"""
@@ -216,15 +383,24 @@ class TestCSVProcessor:
         with patch.object(processor, 'validate_sets') as mock_validate:
             mock_validate.return_value = (True, "平衡確認", None)
             
-            with patch('pathlib.Path.glob') as mock_glob:
-                with patch('shutil.move') as mock_move:
-                    mock_glob.return_value = []  # 移動対象ファイルなし
-                    
-                    result = processor.confirm_entries()
-                    
-                    assert result == True
-                    # SQL実行確認（remove_duplicates, delete_from_journal, insert_into_journal, delete_from_temp）
-                    assert mock_connection.execute.call_count >= 3
+            with patch.object(processor, '_move_confirmed_files') as mock_move:
+                mock_move.return_value = 0  # 移動対象ファイルなし
+                
+                result = processor.confirm_entries()
+                
+                assert result == True
+                # 確定前の検証はキャッシュを使わない
+                mock_validate.assert_called_once_with(conn=mock_connection, use_cache=False)
+                # SQL実行確認（remove_duplicates + 移行（ON CONFLICT） + TRUNCATE + 月次集計ビューの存在確認 + リフレッシュ）
+                assert mock_connection.execute.call_count == 5
+                executed_sql = [str(c.args[0]) for c in mock_connection.execute.call_args_list]
+                assert 'ON CONFLICT (entry_id) DO UPDATE' in executed_sql[1]
+                assert 'TRUNCATE temp_journal' in executed_sql[2]
+                assert 'REFRESH MATERIALIZED VIEW' in str(mock_connection.execute.call_args[0][0])
+                # 重複削除から移行までを1つの接続で実行し、最後に1回だけコミット
+                mock_db_manager.get_connection.assert_called_once()
+                mock_connection.commit.assert_called_once()
+                mock_move.assert_called_once()
 
     def test_confirm_entries_failure(self, processor, mock_db_manager):
         """仕訳確定失敗テスト"""
@@ -242,6 +418,134 @@ class TestCSVProcessor:
             assert result == False
             # remove_duplicate_entries は呼ばれるが、その後の処理は中断される
             mock_connection.execute.assert_called_once()
+            # 重複削除もコミットせずにロールバックする
+            mock_connection.rollback.assert_called_once()
+
+    def test_refresh_monthly_balance(self, processor):
+        """月次集計ビューが存在する場合はリフレッシュするテスト"""
+        mock_connection = MagicMock()
+        mock_connection.execute.return_value.scalar.return_value = True
+        
+        processor._refresh_monthly_balance(mock_connection)
+        
+        executed_sql = [str(c.args[0]) for c in mock_connection.execute.call_args_list]
+        assert 'to_regclass' in executed_sql[0]
+        assert 'REFRESH MATERIALIZED VIEW' in executed_sql[-1]
+
+    def test_refresh_monthly_balance_creates_missing_view(self, processor):
+        """月次集計ビューが存在しない場合は作成のみ行うテスト（init_tables未実行のDB）"""
+        mock_connection = MagicMock()
+        mock_connection.execute.return_value.scalar.return_value = False
+        
+        processor._refresh_monthly_balance(mock_connection)
+        
+        executed_sql = ' '.join(str(c.args[0]) for c in mock_connection.execute.call_args_list)
+        assert 'CREATE MATERIALIZED VIEW IF NOT EXISTS journal_monthly_balance' in executed_sql
+        assert 'ux_journal_monthly_balance' in executed_sql
+        assert 'REFRESH' not in executed_sql
+
+    def test_move_confirmed_files(self, processor, tmp_path):
+        """確定済みCSVファイル移動テスト"""
+        process_dir = tmp_path / 'process'
+        confirmed_dir = tmp_path / 'confirmed'
+        process_dir.mkdir()
+        confirmed_dir.mkdir()
+        (process_dir / 'a.csv').write_text('x')
+        (process_dir / 'b.csv').write_text('y')
+        (process_dir / 'note.txt').write_text('z')
+        
+        with patch('ledger_ingest.processor.PROCESS_DIR', process_dir), \
+             patch('ledger_ingest.processor.CONFIRMED_DIR', confirmed_dir):
+            moved = processor._move_confirmed_files()
+        
+        assert moved == 2
+        assert sorted(p.name for p in confirmed_dir.iterdir()) == ['a.csv', 'b.csv']
+        assert [p.name for p in process_dir.iterdir()] == ['note.txt']
+
+    def test_move_confirmed_files_cross_device(self, processor, tmp_path):
+        """別ファイルシステムへの移動時はshutil.moveにフォールバックするテスト"""
+        process_dir = tmp_path / 'process'
+        confirmed_dir = tmp_path / 'confirmed'
+        process_dir.mkdir()
+        confirmed_dir.mkdir()
+        (process_dir / 'a.csv').write_text('x')
+
+        with patch('ledger_ingest.processor.PROCESS_DIR', process_dir), \
+             patch('ledger_ingest.processor.CONFIRMED_DIR', confirmed_dir), \
+             patch('ledger_ingest.processor.os.replace', side_effect=OSError(errno.EXDEV, 'cross-device link')), \
+             patch('ledger_ingest.processor.shutil.move') as mock_move:
+            moved = processor._move_confirmed_files()
+
+        assert moved == 1
+        mock_move.assert_called_once_with(str(process_dir / 'a.csv'), str(confirmed_dir / 'a.csv'))
+
+    def test_confirm_entries_with_caller_connection(self, processor):
+        """呼び出し元の接続で確定した場合はコミット前のためCSVファイルを移動しないテスト"""
+        mock_connection = MagicMock()
+        
+        with patch.object(processor, '_confirm_in_transaction', return_value=True), \
+             patch.object(processor, '_move_confirmed_files') as mock_move:
+            result = processor.confirm_entries(conn=mock_connection)
+        
+        assert result is True
+        mock_move.assert_not_called()
+        mock_connection.commit.assert_not_called()
+
+    def test_process_and_confirm(self, processor, mock_db_manager, tmp_path):
+        """銀行CSV処理→読み込み→確定を1つの接続で実行し、コミット後に今回の中間CSVのみ移動するテスト"""
+        process_dir = tmp_path / 'process'
+        process_dir.mkdir()
+        (process_dir / 'old.csv').write_text('x')
+        new_file = process_dir / 'ufj_classified.csv'
+        mock_connection = mock_db_manager.get_connection.return_value.__enter__.return_value
+        
+        def move_after_commit(paths):
+            # ファイル移動はコミット後に行われる
+            mock_connection.commit.assert_called_once()
+            return len(paths)
+        
+        with patch('ledger_ingest.processor.PROCESS_DIR', process_dir), \
+             patch.object(processor, 'process_bank_csv', side_effect=lambda *args: new_file.write_text('y')) as mock_bank, \
+             patch.object(processor, 'process_csv_for_database', return_value=2) as mock_load, \
+             patch.object(processor, '_confirm_in_transaction', return_value=True) as mock_confirm, \
+             patch.object(processor, '_move_confirmed_files', side_effect=move_after_commit) as mock_move:
+            result = processor.process_and_confirm('ufj.csv', 'ufj')
+        
+        assert result is True
+        mock_bank.assert_called_once_with('ufj.csv', 'ufj')
+        # 今回生成された中間CSVのみを読み込み・移動する（既存のold.csvは対象外）
+        mock_load.assert_called_once_with(str(new_file), clear_temp=True, conn=mock_connection)
+        mock_confirm.assert_called_once_with(mock_connection)
+        mock_move.assert_called_once_with([str(new_file)])
+        # 読み込みから確定までを1つの接続で実行し、最後に1回だけコミット
+        mock_db_manager.get_connection.assert_called_once()
+        mock_connection.commit.assert_called_once()
+
+    def test_process_and_confirm_validation_failure(self, processor, mock_db_manager, tmp_path):
+        """検証エラー時は中間CSVを移動しないテスト"""
+        new_file = tmp_path / 'ufj_classified.csv'
+        
+        with patch('ledger_ingest.processor.PROCESS_DIR', tmp_path), \
+             patch.object(processor, 'process_bank_csv', side_effect=lambda *args: new_file.write_text('y')), \
+             patch.object(processor, 'process_csv_for_database', return_value=2), \
+             patch.object(processor, '_confirm_in_transaction', return_value=False), \
+             patch.object(processor, '_move_confirmed_files') as mock_move:
+            result = processor.process_and_confirm('ufj.csv', 'ufj')
+        
+        assert result is False
+        mock_move.assert_not_called()
+        assert new_file.exists()
+
+    def test_process_and_confirm_no_output(self, processor, mock_db_manager, tmp_path):
+        """中間CSVが生成されない場合は確定処理を行わないテスト"""
+        with patch('ledger_ingest.processor.PROCESS_DIR', tmp_path), \
+             patch.object(processor, 'process_bank_csv', return_value=0), \
+             patch.object(processor, '_confirm_in_transaction') as mock_confirm:
+            result = processor.process_and_confirm('ufj.csv', 'ufj')
+        
+        assert result is False
+        mock_confirm.assert_not_called()
+        mock_db_manager.get_connection.assert_not_called()
 
     def test_get_cashflow_analysis(self, processor, mock_db_manager):
         """キャッシュフロー分析テスト"""
@@ -264,13 +568,16 @@ class TestCSVProcessor:
 
     def test_financial_records_processing(self, processor):
         """実際の financial_records.csv 処理テスト"""
-        financial_records_path = "/workspace/data/financial_records.csv"
+        financial_records_path = DATA_DIR / 'financial_records.csv'
         
         # ファイル存在確認
-        if not Path(financial_records_path).exists():
+        if not financial_records_path.exists():
             pytest.skip("financial_records.csv not found")
         
-        with patch.object(processor.db, 'get_connection'):
+        with patch.object(processor.db, 'get_connection') as mock_get_conn:
+            mock_result = mock_get_conn.return_value.__enter__.return_value.execute.return_value
+            mock_result.scalar.return_value = False  # 重複チェック（EXISTS）は未処理
+            mock_result.rowcount = 0
             with patch('pandas.DataFrame.to_sql') as mock_to_sql:
                 result = processor.process_csv_for_database(financial_records_path)
                 
@@ -310,45 +617,24 @@ class TestCSVProcessor:
                         assert confirm_result == True
                         assert isinstance(trial_balance, pd.DataFrame)
 
-    def test_error_handling(self, processor):
+    def test_error_handling(self, processor, temp_csv_file, mock_db_manager):
         """エラーハンドリングテスト"""
         # 存在しないファイル
         with pytest.raises(FileNotFoundError):
             processor.process_csv_for_database("nonexistent.csv")
         
-        # 不正なCSV形式
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            f.write("invalid,csv,format\n1,2")  # 列数不一致
-            f.flush()
-            
-            try:
-                with patch.object(processor.db, 'get_connection'):
-                    # pandas.read_csvがエラーを出すかテスト
-                    with pytest.raises(Exception):  # 何らかのエラーが発生することを期待
-                        processor.process_csv_for_database(f.name)
-            finally:
-                os.unlink(f.name)
+        # 不正なCSV形式（ファイルを書かずにread_csvのパースエラーを再現）
+        mock_connection = mock_db_manager.get_connection.return_value.__enter__.return_value
+        mock_connection.execute.return_value.scalar.return_value = False
+        mock_connection.execute.return_value.rowcount = 0
+        with patch('pandas.read_csv', side_effect=pd.errors.ParserError('列数不一致')):
+            with pytest.raises(pd.errors.ParserError):
+                processor.process_csv_for_database(temp_csv_file)
 
-    def test_subject_code_mapping(self, processor, temp_csv_file):
+    def test_subject_code_mapping(self, processor, sample_df):
         """科目コードマッピングテスト"""
-        original_to_sql = pd.DataFrame.to_sql
-        captured_df = None
-        
-        def capture_df(self, *args, **kwargs):
-            nonlocal captured_df
-            captured_df = self.copy()
-            return original_to_sql(self, *args, **kwargs)
-        
-        with patch('pandas.DataFrame.to_sql', capture_df):
-            with patch('pandas.read_sql') as mock_read_sql:
-                # 重複チェックのモック（重複なし）
-                mock_read_sql.return_value = pd.DataFrame({'count': [0]})
-                with patch.object(processor.db, 'get_connection') as mock_get_conn:
-                    # connectionオブジェクトのモック設定
-                    mock_conn = mock_get_conn.return_value.__enter__.return_value
-                    mock_result = mock_conn.execute.return_value
-                    mock_result.rowcount = 0  # rowcountを整数値に設定
-                    processor.process_csv_for_database(temp_csv_file)
+        # ファイル読み込み・DB投入を介さず、パース済みのDataFrameを直接変換
+        captured_df = processor._transform_journal_chunk(sample_df.copy(), 'sample.csv', {})
         
         # 科目名マッピングの確認
         assert captured_df is not None
@@ -374,19 +660,20 @@ class TestCSVProcessor:
             
             def capture_df(self, *args, **kwargs):
                 nonlocal captured_df
-                captured_df = self.copy()
+                captured_df = self
                 return original_to_sql(self, *args, **kwargs)
             
             try:
                 with patch('pandas.DataFrame.to_sql', capture_df):
-                    with patch('pandas.read_sql') as mock_read_sql:
-                        mock_read_sql.return_value = pd.DataFrame({'count': [0]})
-                        with patch.object(processor.db, 'get_connection') as mock_get_conn:
-                            # connectionオブジェクトのモック設定
-                            mock_conn = mock_get_conn.return_value.__enter__.return_value
-                            mock_result = mock_conn.execute.return_value
-                            mock_result.rowcount = 0  # rowcountを整数値に設定
-                            processor.process_csv_for_database(f.name)
+                    with patch.object(processor.db, 'get_connection') as mock_get_conn:
+                        # connectionオブジェクトのモック設定
+                        mock_conn = mock_get_conn.return_value.__enter__.return_value
+                        mock_result = mock_conn.execute.return_value
+                        mock_result.rowcount = 0  # rowcountを整数値に設定
+                        mock_result.scalar.return_value = False  # 未取り込みファイル
+                        processor.process_csv_for_database(f.name)
+                        # 取り込み済み確認はEXISTSクエリで行う
+                        assert 'EXISTS' in str(mock_conn.execute.call_args_list[0].args[0])
                 
                 # EntryID生成確認
                 assert captured_df is not None
@@ -406,6 +693,202 @@ class TestCSVProcessor:
             finally:
                 os.unlink(f.name)
 
+    def test_entry_id_continues_across_chunks(self, processor):
+        """チャンク分割読み込み時もEntryIDの連番が引き継がれることのテスト"""
+        test_data = """Date,ID,SubjectCode,Amount,Remarks,SetID
+                        2024-03-01,,100,-1000,Test,01
+                        2024-03-01,,500,500,Test,01
+                        2024-03-01,,530,500,Test,01
+                        2024-03-02,,101,-2000,Another,02
+                        2024-03-02,,530,2000,Another,02"""
+        
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
+            f.write(test_data)
+            f.flush()
+            
+            captured = []
+            
+            def capture_df(self, *args, **kwargs):
+                captured.append(self)
+            
+            try:
+                with patch('ledger_ingest.processor.READ_CSV_CHUNKSIZE', 2):
+                    with patch('pandas.DataFrame.to_sql', capture_df):
+                        with patch.object(processor.db, 'get_connection') as mock_get_conn:
+                            mock_conn = mock_get_conn.return_value.__enter__.return_value
+                            mock_conn.execute.return_value.scalar.return_value = False
+                            mock_conn.execute.return_value.rowcount = 0
+                            result = processor.process_csv_for_database(f.name)
+                
+                assert result == 5
+                assert len(captured) == 3
+                entry_ids = pd.concat(captured)['entry_id'].tolist()
+                assert entry_ids == [
+                    '20240301_001_000', '20240301_001_001', '20240301_001_002',
+                    '20240302_002_000', '20240302_002_001'
+                ]
+            finally:
+                os.unlink(f.name)
+
+    def test_amount_cleaning(self, processor):
+        """Amount列のクリーニングテスト（不正文字を含む行のみ再変換）"""
+        test_data = """Date,ID,SubjectCode,Amount,Remarks,SetID
+                        2024-03-01,,100,-1000m,Test,01
+                        2024-03-01,,500,1000,Test,01
+                        2024-03-02,,101,,Another,02
+                        2024-03-02,,530,2000.5,Another,02"""
+        
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
+            f.write(test_data)
+            f.flush()
+            
+            original_to_sql = pd.DataFrame.to_sql
+            captured_df = None
+            
+            def capture_df(self, *args, **kwargs):
+                nonlocal captured_df
+                captured_df = self
+                return original_to_sql(self, *args, **kwargs)
+            
+            try:
+                with patch('pandas.DataFrame.to_sql', capture_df):
+                    with patch.object(processor.db, 'get_connection') as mock_get_conn:
+                        mock_conn = mock_get_conn.return_value.__enter__.return_value
+                        mock_conn.execute.return_value.rowcount = 0
+                        mock_conn.execute.return_value.scalar.return_value = False  # 未取り込みファイル
+                        processor.process_csv_for_database(f.name)
+                        # 取り込み済み確認はEXISTSクエリで行う
+                        assert 'EXISTS' in str(mock_conn.execute.call_args_list[0].args[0])
+                
+                assert captured_df is not None
+                assert captured_df['amount'].dtype == 'float64'
+                assert captured_df['amount'].tolist() == [-1000.0, 1000.0, 0.0, 2000.5]
+            finally:
+                os.unlink(f.name)
+
+    def test_determine_direction_and_amount(self, processor):
+        """UFJ明細の取引方向・金額判定テスト"""
+        df = pd.DataFrame({
+            '支払い金額': ['1,000', None, '', 'abc', '0'],
+            '預かり金額': [None, '2,500', '300', None, '0']
+        })
+        
+        assert processor._determine_direction(df).tolist() == ['out', 'in', 'in', 'unknown', 'unknown']
+        assert processor._calculate_amount(df).tolist() == [1000.0, 2500.0, 300.0, 0.0, 0.0]
+
+    def test_parse_dates(self, processor):
+        """日付列のベクトル化パーステスト（YYYYMMDD形式と混在形式）"""
+        dates = pd.Series(['20240301', '2024-03-02', '2024/03/03', 20240304, 'invalid', None])
+        parsed = processor._parse_dates(dates)
+
+        assert parsed.iloc[:4].dt.strftime('%Y-%m-%d').tolist() == [
+            '2024-03-01', '2024-03-02', '2024-03-03', '2024-03-04'
+        ]
+        assert parsed.iloc[4:].isna().all()
+
+    def test_transform_journal_chunk_invalid_date_fallback(self, processor):
+        """日付をパースできない仕訳は除外せず2000-01-01として取り込むテスト"""
+        chunk = pd.DataFrame({
+            'Date': ['2024-03-01', 'invalid'],
+            'SubjectCode': [100, 500],
+            'Amount': ['-1000', '1000'],
+            'Remarks': ['Test', 'Test'],
+            'SetID': ['01', '01'],
+        })
+        
+        df = processor._transform_journal_chunk(chunk, 'sample.csv', {})
+        
+        assert len(df) == 2
+        assert df['date'].dt.strftime('%Y-%m-%d').tolist() == ['2024-03-01', '2000-01-01']
+        assert df['set_id'].tolist() == ['20240301_001', '20000101_001']
+
+    def test_transform_journal_chunk_keeps_long_set_ids(self, processor):
+        """3桁を超えるSetID・EntryID連番を切り詰めずに取り込むテスト"""
+        chunk = pd.DataFrame({
+            'Date': ['2024-03-01'] * 3,
+            'SubjectCode': [598, 101, 598],
+            'Amount': ['1500', '-1500', '0'],
+            'Remarks': ['Test'] * 3,
+            'SetID': ['20240301_000', '20240301_000', '20240301_001'],
+        })
+        
+        df = processor._transform_journal_chunk(chunk, 'ufj_classified.csv', {'20240301_20240301_001': 1000})
+        
+        assert df['set_id'].tolist() == ['20240301_20240301_000', '20240301_20240301_000', '20240301_20240301_001']
+        assert df['entry_id'].tolist() == ['20240301_20240301_000_000', '20240301_20240301_000_001',
+                                           '20240301_20240301_001_1000']
+
+    def test_save_entries_to_db_entry_ids(self, processor):
+        """銀行明細保存時のEntryID採番テスト（連続・非連続のSetID）"""
+        captured = []
+
+        def capture_df(self, *args, **kwargs):
+            captured.append(self)
+
+        for set_ids in (['A', 'A', 'A', 'B'], ['A', 'B', 'A', 'B']):
+            entries = pd.DataFrame({
+                'Date': ['2024-01-05'] * 4,
+                'SubjectCode': ['598', '101', '500', '101'],
+                'Amount': [100, -100, 200, -200],
+                'Remarks': ['lunch'] * 4,
+                'SetID': set_ids
+            })
+            with patch('pandas.DataFrame.to_sql', capture_df):
+                assert processor._save_entries_to_db(entries, 'ufj.csv') == 4
+
+        assert captured[0]['entry_id'].tolist() == ['A_000', 'A_001', 'A_002', 'B_000']
+        assert captured[1]['entry_id'].tolist() == ['A_000', 'B_000', 'A_001', 'B_001']
+
+    def test_read_bank_csv_detects_encoding(self, processor, tmp_path):
+        """銀行CSVの文字コード判定テスト（shift_jis / utf-8 / BOM付きutf-8）"""
+        content = "日付,摘要,支払い金額\n2024/01/05,コンビニ,500\n"
+        for encoding in ['shift_jis', 'utf-8', 'utf-8-sig']:
+            path = tmp_path / f"{encoding}.csv"
+            path.write_bytes(content.encode(encoding))
+
+            assert processor._detect_csv_encoding(str(path)) == encoding
+            df = processor._read_bank_csv(str(path))
+            assert df.columns.tolist() == ['日付', '摘要', '支払い金額']
+            assert df['摘要'].tolist() == ['コンビニ']
+
+    def test_predict_subject_code_ml_batch_invalid_label(self, processor):
+        """'借方_貸方' 形式でない予測ラベルはその行のみデフォルト値になるテスト"""
+        predictor = processor.bank_predictor
+        model = MagicMock()
+        model.predict_proba.return_value = np.array([[0.9, 0.1], [0.8, 0.2], [0.7, 0.3]])
+        model.predict.return_value = np.array([0, 1, 2])
+        encoder = MagicMock()
+        encoder.inverse_transform.return_value = np.array(['500_101', 'invalid', '1_2_3'], dtype=object)
+        
+        with patch.dict(predictor.models, {'test': {'subject_code': model}}), \
+             patch.dict(predictor.encoders, {'test': {'subject_code': encoder}}):
+            debit, credit, confidence = predictor.predict_subject_code_ml_batch(['a', 'b', 'c'], bank='test')
+        
+        assert debit.tolist() == ['500', '598', '598']
+        assert credit.tolist() == ['101', '101', '101']
+        assert confidence.tolist() == [0.9, 0.0, 0.0]
+
+    def test_convert_to_double_entry(self, processor):
+        """複式簿記形式への変換テスト（金額0の行は除外、借方・貸方が交互に並ぶ）"""
+        df = pd.DataFrame({
+            'date': ['2024-01-05', '2024-01-06', '2024-02-01'],
+            'amount': [1000.4, 0.0, 2500.0],
+            'final_debit': ['598', '101', '510'],
+            'final_credit': ['101', '490', '101'],
+            'final_remarks': ['lunch', 'zero', 'rent']
+        }, index=[0, 3, 7])
+
+        entries = processor._convert_to_double_entry(df)
+
+        assert entries['SubjectCode'].tolist() == ['598', '101', '510', '101']
+        assert entries['Amount'].tolist() == [1000, -1000, 2500, -2500]
+        assert entries['SetID'].tolist() == ['20240105_000', '20240105_000', '20240201_007', '20240201_007']
+        assert entries['Remarks'].tolist() == ['lunch', 'lunch', 'rent', 'rent']
+
+        # JCBは科目列がない場合に雑費/JCBをデフォルトとする
+        jcb_entries = processor._convert_to_double_entry_jcb(df.drop(columns=['final_debit', 'final_credit']))
+        assert jcb_entries['SubjectCode'].tolist() == ['598', '201', '598', '201']
+
     def test_remove_duplicate_entries(self, processor, mock_db_manager):
         """重複entry_id削除機能テスト"""
         mock_connection = mock_db_manager.get_connection.return_value.__enter__.return_value
@@ -466,17 +949,16 @@ class TestCSVProcessor:
             with patch.object(processor, 'remove_duplicate_entries') as mock_remove_dup:
                 mock_remove_dup.return_value = 1  # 1件削除
                 
-                with patch('pathlib.Path.glob') as mock_glob:
-                    with patch('shutil.move') as mock_move:
-                        mock_glob.return_value = []  # 移動対象ファイルなし
-                        
-                        result = processor.confirm_entries()
-                        
-                        assert result == True
-                        # 重複削除が最初に実行されることを確認
-                        mock_remove_dup.assert_called_once()
-                        # セット検証が重複削除の後に実行されることを確認
-                        mock_validate.assert_called_once()
+                with patch.object(processor, '_move_confirmed_files') as mock_move:
+                    mock_move.return_value = 0  # 移動対象ファイルなし
+                    
+                    result = processor.confirm_entries()
+                    
+                    assert result == True
+                    # 重複削除が最初に実行されることを確認
+                    mock_remove_dup.assert_called_once()
+                    # セット検証が重複削除の後に実行されることを確認
+                    mock_validate.assert_called_once()
 
     def test_duplicate_entry_integration(self, processor):
         """重複entry_id統合テスト（実際のデータ処理）"""
@@ -496,7 +978,8 @@ class TestCSVProcessor:
             
             def capture_df(self, *args, **kwargs):
                 nonlocal captured_df
-                captured_df = self.copy()
+                # 検証に使うentry_id列のみ複製（書き換えが投入対象のチャンクに波及しないようにする）
+                captured_df = self[['entry_id']].copy()
                 # 意図的に重複entry_idを作成
                 if len(captured_df) > 0:
                     captured_df.loc[captured_df.index[1], 'entry_id'] = captured_df.loc[captured_df.index[0], 'entry_id']
@@ -504,13 +987,14 @@ class TestCSVProcessor:
             
             try:
                 with patch('pandas.DataFrame.to_sql', capture_df):
-                    with patch('pandas.read_sql') as mock_read_sql:
-                        mock_read_sql.return_value = pd.DataFrame({'count': [0]})
-                        with patch.object(processor.db, 'get_connection') as mock_get_conn:
-                            mock_conn = mock_get_conn.return_value.__enter__.return_value
-                            mock_result = mock_conn.execute.return_value
-                            mock_result.rowcount = 0
-                            processor.process_csv_for_database(f.name)
+                    with patch.object(processor.db, 'get_connection') as mock_get_conn:
+                        mock_conn = mock_get_conn.return_value.__enter__.return_value
+                        mock_result = mock_conn.execute.return_value
+                        mock_result.rowcount = 0
+                        mock_result.scalar.return_value = False  # 未取り込みファイル
+                        processor.process_csv_for_database(f.name)
+                        # 取り込み済み確認はEXISTSクエリで行う
+                        assert 'EXISTS' in str(mock_conn.execute.call_args_list[0].args[0])
                 
                 # テストデータに重複が作成されていることを確認
                 assert captured_df is not None
@@ -3,15 +3,22 @@ Integration test for the complete CSVProcessor workflow using financial_records.
 This test demonstrates the end-to-end processing that produces financial_balance_sheet.csv format
 """
 
-import sys
 import os
-sys.path.append('/workspace')
+import re
+import inspect
 
 from ledger_ingest.processor import CSVProcessor
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import tempfile
 
+# リポジトリ直下のdata/ディレクトリ
+DATA_DIR = Path(__file__).parent.parent / 'data'
+
+# 備考末尾のセット番号
+SET_NUMBER_RE = re.compile(r'(\d+)$')
+
 
 def test_integration_workflow():
     """Complete integration test for CSVProcessor workflow"""
@@ -50,9 +57,11 @@ def test_integration_workflow():
         
         # SetIDとEntryID生成のテスト
         df['Date'] = pd.to_datetime(df['Date'])
-        df['SetID'] = df['Date'].dt.strftime('%Y%m%d') + '_' + df['Remarks'].str.extract(r'(\d+)$')[0].fillna('00')
-        df['EntryID'] = df.groupby('SetID').cumcount().astype(str).str.zfill(2)
-        df['EntryID'] = df['SetID'].astype(str) + '_' + df['EntryID']
+        # SetIDはグループ化キーとして繰り返し使うためカテゴリ型にする
+        df['SetID'] = (df['Date'].dt.strftime('%Y%m%d') + '_' + df['Remarks'].str.extract(SET_NUMBER_RE, expand=False).fillna('00')).astype('category')
+        # EntryID = SetID + '_' + セット内連番（numpyの文字列演算で一度に組み立てる）
+        entry_seq = np.char.zfill(df.groupby('SetID', observed=True, sort=False).cumcount().to_numpy().astype(str), 2)
+        df['EntryID'] = np.char.add(np.char.add(df['SetID'].to_numpy().astype(str), '_'), entry_seq)
         
         print(f"✓ CSV読み込み完了: {len(df)}行")
         print(f"✓ SetID生成完了: {df['SetID'].nunique()}個のユニークなSetID")
@@ -60,7 +69,7 @@ def test_integration_workflow():
         
         # SetIDグループの平衡チェック
         print("\n--- Step 2: セット平衡チェック ---")
-        balance_check = df.groupby('SetID')['Amount'].sum()
+        balance_check = df.groupby('SetID', observed=True, sort=False)['Amount'].sum()
         unbalanced_sets = balance_check[abs(balance_check) > 0.01]
         
         if len(unbalanced_sets) == 0:
@@ -72,9 +81,9 @@ def test_integration_workflow():
         
         # 科目コードマッピングのテスト
         print("\n--- Step 3: 科目コードマッピング ---")
-        from ledger_ingest.config import SUBJECT_CODES
+        from ledger_ingest.config import SUBJECT_CODES_SERIES
         
-        df['Subject'] = df['SubjectCode'].map(SUBJECT_CODES)
+        df['Subject'] = df['SubjectCode'].map(SUBJECT_CODES_SERIES)
         mapped_count = df['Subject'].notna().sum()
         mapping_ratio = mapped_count / len(df)
         
@@ -84,7 +93,8 @@ def test_integration_workflow():
         print("\n--- Step 4: 月次集計シミュレーション ---")
         df['Year'] = df['Date'].dt.year
         df['Month'] = df['Date'].dt.month
-        df['YearMonth'] = df['Date'].dt.strftime('%Y-%m')
+        # 年月は整数の序数を持つPeriodで集計し、文字列化は出力時のみ行う
+        df['YearMonth'] = df['Date'].dt.to_period('M')
         
         monthly_summary = df.groupby(['YearMonth', 'SubjectCode'])['Amount'].sum().unstack(fill_value=0)
         
@@ -95,55 +105,41 @@ def test_integration_workflow():
         # financial_balance_sheet.csv形式のシミュレーション
         print("\n--- Step 5: Balance Sheet形式生成 ---")
         
-        # 主要科目の集計
-        balance_sheet_data = []
-        for year_month in monthly_summary.index:
-            row = {'YearMonth': year_month}
-            
-            # 個別科目
-            for code in [100, 101, 102, 200, 500, 530, 531]:
-                if code in monthly_summary.columns:
-                    row[str(code)] = monthly_summary.loc[year_month, code]
-                else:
-                    row[str(code)] = 0
-            
-            # 集計項目
-            assets = sum(monthly_summary.loc[year_month, code] for code in monthly_summary.columns if 100 <= code <= 199)
-            liabilities = sum(monthly_summary.loc[year_month, code] for code in monthly_summary.columns if 200 <= code <= 399)
-            income = sum(monthly_summary.loc[year_month, code] for code in monthly_summary.columns if 400 <= code <= 499)
-            expenses = sum(monthly_summary.loc[year_month, code] for code in monthly_summary.columns if 500 <= code <= 699)
-            
-            row['TotalAssets'] = assets
-            row['TotalLiabilities'] = liabilities
-            row['TotalIncome'] = income
-            row['TotalExpenses'] = expenses
-            row['NetIncome'] = income + expenses
-            row['TotalEquity'] = assets - liabilities
-            
-            balance_sheet_data.append(row)
+        # 主要科目の集計（存在しない科目は0で補完）
+        key_codes = [100, 101, 102, 200, 500, 530, 531]
+        balance_sheet_df = monthly_summary.reindex(columns=key_codes, fill_value=0).rename(columns=str)
         
-        balance_sheet_df = pd.DataFrame(balance_sheet_data)
+        # 集計項目（科目コードを1回のdigitizeで区分に振り分け、区分ごとの列マスクで月ごとに一括合計）
+        # 区分: 1=資産(100-199), 2=負債(200-399), 3=収益(400-499), 4=費用(500-699)
+        category = np.digitize(monthly_summary.columns.to_numpy(), [100, 200, 400, 500, 700])
+        for index, name in enumerate(['TotalAssets', 'TotalLiabilities', 'TotalIncome', 'TotalExpenses'], 1):
+            balance_sheet_df[name] = monthly_summary.loc[:, category == index].sum(axis=1)
+        balance_sheet_df['NetIncome'] = balance_sheet_df['TotalIncome'] + balance_sheet_df['TotalExpenses']
+        balance_sheet_df['TotalEquity'] = balance_sheet_df['TotalAssets'] - balance_sheet_df['TotalLiabilities']
+        balance_sheet_df.index = balance_sheet_df.index.strftime('%Y-%m')
+        balance_sheet_df = balance_sheet_df.rename_axis(index='YearMonth', columns=None).reset_index()
         
         print("✓ Balance Sheet形式生成完了:")
         print(balance_sheet_df.to_string())
         
         # 実際のfinancial_records.csvとの比較テスト
         print("\n--- Step 6: 実データとの比較 ---")
-        financial_records_path = "/workspace/data/financial_records.csv"
-        financial_balance_path = "/workspace/data/financial_balance_sheet.csv"
+        financial_records_path = DATA_DIR / 'financial_records.csv'
+        financial_balance_path = DATA_DIR / 'financial_balance_sheet.csv'
         
-        if Path(financial_records_path).exists():
-            real_df = pd.read_csv(financial_records_path)
+        if financial_records_path.exists():
+            # 使う列だけを読み込み、日付は読み込み時にパース
+            real_df = pd.read_csv(financial_records_path, usecols=['Date', 'Amount', 'Remarks'],
+                                  dtype={'Remarks': str}, parse_dates=['Date'])
             print(f"✓ 実際のfinancial_records.csv読み込み完了: {len(real_df)}行")
             
             # SetID生成テスト
-            real_df['Date'] = pd.to_datetime(real_df['Date'])
-            real_df['SetID'] = real_df['Date'].dt.strftime('%Y%m%d') + '_' + real_df['Remarks'].str.extract(r'(\d+)$')[0].fillna('00')
+            real_df['SetID'] = (real_df['Date'].dt.strftime('%Y%m%d') + '_' + real_df['Remarks'].str.extract(SET_NUMBER_RE, expand=False).fillna('00')).astype('category')
             unique_setids = real_df['SetID'].nunique()
             print(f"✓ 実データのSetID生成: {unique_setids}個のユニークなSetID")
             
             # セット平衡チェック
-            real_balance_check = real_df.groupby('SetID')['Amount'].sum()
+            real_balance_check = real_df.groupby('SetID', observed=True, sort=False)['Amount'].sum()
             real_unbalanced = real_balance_check[abs(real_balance_check) > 0.01]
             
             if len(real_unbalanced) == 0:
@@ -151,7 +147,7 @@ def test_integration_workflow():
             else:
                 print(f"⚠ 実データの不平衡SetID: {len(real_unbalanced)}個")
         
-        if Path(financial_balance_path).exists():
+        if financial_balance_path.exists():
             expected_df = pd.read_csv(financial_balance_path)
             print(f"✓ 期待されるfinancial_balance_sheet.csv読み込み完了: {len(expected_df)}行")
             print("期待される出力形式の列:")
@@ -191,13 +187,12 @@ def demo_csvprocessor_methods():
     
     processor = CSVProcessor()
     
-    # 利用可能なメソッドの表示
-    methods = [method for method in dir(processor) if not method.startswith('_') and callable(getattr(processor, method))]
+    # 利用可能なメソッドの表示（属性は1回の走査で取得し、表示時に再取得しない）
+    methods = [(name, member) for name, member in inspect.getmembers(processor, callable) if not name.startswith('_')]
     
     print("利用可能なメソッド:")
-    for i, method in enumerate(methods, 1):
-        method_obj = getattr(processor, method)
-        if hasattr(method_obj, '__doc__') and method_obj.__doc__:
+    for i, (method, method_obj) in enumerate(methods, 1):
+        if method_obj.__doc__:
             doc_first_line = method_obj.__doc__.strip().split('\n')[0]
             print(f"{i:2d}. {method:<35} - {doc_first_line}")
         else:
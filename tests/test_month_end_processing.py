@@ -4,26 +4,25 @@ import tempfile
 import os
 from pathlib import Path
 from unittest.mock import Mock, patch, MagicMock
-
-import sys
-sys.path.append(str(Path(__file__).parent.parent))
+from sqlalchemy import create_engine
 
 from ledger_ingest.processor import CSVProcessor
-from ledger_ingest.database import DatabaseManager
+from ledger_ingest.database import DatabaseManager, CREATE_TEMP_JOURNAL_SQL
 
+# リポジトリ直下のdata/ディレクトリ
+DATA_DIR = Path(__file__).parent.parent / 'data'
 
-class TestMonthEndProcessing:
-    """月末処理とfinancial_balance_sheet.csv形式出力テスト"""
-    
-    @pytest.fixture
-    def processor(self):
-        """CSVProcessor インスタンス"""
-        return CSVProcessor()
 
-    @pytest.fixture
-    def sample_financial_data(self):
-        """financial_records.csvと同様の形式のサンプルデータ"""
-        return """Date,ID,SubjectCode,Amount,Remarks,SetID
+@pytest.fixture(scope='module')
+def processor():
+    """CSVProcessor インスタンス（銀行分類器の初期化が重いためモジュール内で共有）"""
+    return CSVProcessor()
+
+
+@pytest.fixture(scope='module')
+def sample_financial_data():
+    """financial_records.csvと同様の形式のサンプルデータ"""
+    return """Date,ID,SubjectCode,Amount,Remarks,SetID
 2024-03-01,,101,-44881,Carry over,99
 2024-03-01,,109,0,Carry over,99
 2024-03-01,,200,0,Carry over,99
@@ -38,60 +37,54 @@ class TestMonthEndProcessing:
 2024-04-01,,101,-5000,Monthly Start,01
 2024-04-01,,500,5000,Monthly Start,01"""
 
+
+@pytest.fixture(scope='module')
+def temp_financial_csv(sample_financial_data, tmp_path_factory):
+    """一時的な金融データCSVファイル（読み取り専用のためモジュール内で共有）"""
+    path = tmp_path_factory.mktemp('financial') / 'sample_financial.csv'
+    path.write_text(sample_financial_data)
+    return str(path)
+
+
+class TestMonthEndProcessing:
+    """月末処理とfinancial_balance_sheet.csv形式出力テスト"""
+    
     @pytest.fixture
-    def temp_financial_csv(self, sample_financial_data):
-        """一時的な金融データCSVファイル"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            f.write(sample_financial_data)
-            f.flush()
-            yield f.name
-        os.unlink(f.name)
+    def loaded_journal(self, processor, temp_financial_csv):
+        """サンプルCSVをインメモリSQLiteのtemp_journalへ取り込み、投入結果を読み戻す"""
+        engine = create_engine('sqlite:///:memory:')
+        with engine.begin() as conn:
+            conn.execute(CREATE_TEMP_JOURNAL_SQL)
+        with patch.object(processor.db, 'get_connection', side_effect=engine.connect):
+            processor.process_csv_for_database(temp_financial_csv)
+        loaded = pd.read_sql('SELECT * FROM temp_journal', engine)
+        engine.dispose()
+        return loaded
 
-    def test_entry_id_generation_from_remarks(self, processor, temp_financial_csv):
+    def test_entry_id_generation_from_remarks(self, loaded_journal):
         """Remarksフィールドからの適切なEntryID生成テスト"""
-        original_to_sql = pd.DataFrame.to_sql
-        captured_df = None
-        
-        def capture_df(self, *args, **kwargs):
-            nonlocal captured_df
-            captured_df = self.copy()
-            return original_to_sql(self, *args, **kwargs)
-        
-        with patch('pandas.DataFrame.to_sql', capture_df):
-            with patch('pandas.read_sql') as mock_read_sql:
-                mock_read_sql.return_value = pd.DataFrame({'count': [0]})
-                with patch.object(processor.db, 'get_connection') as mock_get_conn:
-                    # connectionオブジェクトのモック設定
-                    mock_conn = mock_get_conn.return_value.__enter__.return_value
-                    mock_result = mock_conn.execute.return_value
-                    mock_result.rowcount = 0  # rowcountを整数値に設定
-                    processor.process_csv_for_database(temp_financial_csv)
-        
-        assert captured_df is not None
+        assert len(loaded_journal) > 0
         
         # SetIDが適切に生成されているか確認
-        assert 'set_id' in captured_df.columns
-        assert captured_df['set_id'].notna().all()
+        assert 'set_id' in loaded_journal.columns
+        assert loaded_journal['set_id'].notna().all()
         
-        # 既存SetIDが日付形式で変換されているか確認
-        carry_over_entries = captured_df[captured_df['remarks'].str.contains('Carry over')]
+        # 既存SetIDが日付形式で変換されているか確認（取り込み時にremarksは小文字化され、繰越フラグが立つ）
+        carry_over_entries = loaded_journal[loaded_journal['is_carry_over'].astype(bool)]
         assert len(carry_over_entries) > 0
+        assert (carry_over_entries['remarks'] == 'carry over').all()
         # SetID 99 -> 20240301_099 のような形式になっているはず（3桁）
         assert carry_over_entries['set_id'].iloc[0].endswith('_099')
         
         # EntryIDが適切に生成されているか確認
-        assert 'entry_id' in captured_df.columns
-        assert captured_df['entry_id'].notna().all()
+        assert 'entry_id' in loaded_journal.columns
+        assert loaded_journal['entry_id'].notna().all()
         
-        # 同じSetIDのエントリが連番になっているか確認
-        for set_id in captured_df['set_id'].unique():
-            set_entries = captured_df[captured_df['set_id'] == set_id].sort_values('entry_id')
-            entry_ids = set_entries['entry_id'].tolist()
-            assert len(entry_ids) >= 1
-            # EntryIDが SetID + '_' + 連番 の形式になっているか確認（3桁）
-            for i, entry_id in enumerate(entry_ids):
-                expected_suffix = f"_{str(i).zfill(3)}"
-                assert entry_id.endswith(expected_suffix)
+        # 同じSetIDのエントリが連番になっているか確認（1回のソートで全セットを検証）
+        # EntryIDが SetID + '_' + 連番 の形式になっているか確認（3桁）
+        ordered = loaded_journal.sort_values(['set_id', 'entry_id'])
+        expected_seq = ordered.groupby('set_id', sort=False).cumcount().astype(str).str.zfill(3)
+        assert (ordered['entry_id'] == ordered['set_id'] + '_' + expected_seq).all()
 
     def test_monthly_aggregation_logic(self, processor):
         """月次集計ロジックのテスト"""
@@ -109,17 +102,10 @@ class TestMonthEndProcessing:
             mock_connection = mock_conn.return_value.__enter__.return_value
             
             with patch('pandas.read_sql') as mock_read_sql:
-                # 期待される月次集計データ
-                expected_monthly_data = pd.DataFrame({
-                    'YearMonth': ['2024-03', '2024-04'],
-                    '100': [-20000, 0],  # 現金
-                    '101': [-1850, -5000],  # 普通預金 (44881 + 1850 = 46731)
-                    '200': [-2000, 0],  # 交通費
-                    '500': [2700, 5000],  # 食費 (850 + 1850 = 2700)
-                    'TotalAssets': [-19150, -5000],
-                    'TotalExpenses': [2700, 5000]
-                })
-                mock_read_sql.return_value = expected_monthly_data
+                # 月次残高ビューは年月×科目コード単位の縦持ちで返る
+                mock_read_sql.return_value = (
+                    mock_journal_data.groupby(['year', 'month', 'subject_code'], as_index=False)['amount'].sum()
+                )
                 
                 # 月次集計取得の実行
                 result = processor.get_monthly_balance_summary()
@@ -127,6 +113,12 @@ class TestMonthEndProcessing:
                 assert isinstance(result, pd.DataFrame)
                 assert 'YearMonth' in result.columns
                 assert len(result) == 2  # 2024-03と2024-04
+                
+                # 縦持ちの集計結果が年月×科目の横持ちに展開されていること
+                assert result['YearMonth'].tolist() == ['2024-03', '2024-04']
+                assert result['100'].tolist() == [-20000, 0]
+                assert result['TotalAssets'].tolist() == [-20000, -5000]
+                assert result['TotalExpenses'].tolist() == [850, 0]
 
     def test_balance_sheet_format_generation(self, processor):
         """financial_balance_sheet.csv形式の出力テスト"""
@@ -209,17 +201,20 @@ class TestMonthEndProcessing:
 
     def test_real_financial_records_processing(self, processor):
         """実際のfinancial_records.csvファイル処理テスト"""
-        financial_records_path = "/workspace/data/financial_records.csv"
+        financial_records_path = DATA_DIR / 'financial_records.csv'
         
-        if not Path(financial_records_path).exists():
+        if not financial_records_path.exists():
             pytest.skip("financial_records.csv not found")
         
-        # 実際のファイルサイズ確認
-        df = pd.read_csv(financial_records_path)
+        # 実際のファイルサイズ確認（行数のみ必要なため1列だけ読み込む）
+        df = pd.read_csv(financial_records_path, usecols=['Date'])
         assert len(df) > 500  # 682行以上あることを確認
         
         # SetIDとEntryIDの生成テスト
-        with patch.object(processor.db, 'get_connection'):
+        with patch.object(processor.db, 'get_connection') as mock_get_conn:
+            mock_result = mock_get_conn.return_value.__enter__.return_value.execute.return_value
+            mock_result.scalar.return_value = False  # 重複チェック（EXISTS）は未処理
+            mock_result.rowcount = 0
             with patch('pandas.DataFrame.to_sql') as mock_to_sql:
                 result = processor.process_csv_for_database(financial_records_path)
                 
@@ -229,19 +224,17 @@ class TestMonthEndProcessing:
 
     def test_balance_sheet_output_format_compatibility(self, processor):
         """financial_balance_sheet.csv出力形式との互換性テスト"""
-        expected_balance_sheet_path = "/workspace/data/financial_balance_sheet.csv"
+        expected_balance_sheet_path = DATA_DIR / 'financial_balance_sheet.csv'
         
-        if not Path(expected_balance_sheet_path).exists():
+        if not expected_balance_sheet_path.exists():
             pytest.skip("financial_balance_sheet.csv not found")
         
-        # 期待される出力形式の確認
-        expected_df = pd.read_csv(expected_balance_sheet_path)
-        expected_columns = expected_df.columns.tolist()
+        # 期待される出力形式の確認（列名はヘッダのみ、行数は先頭列のみ読み込んで取得）
+        expected_columns = pd.read_csv(expected_balance_sheet_path, nrows=0).columns.tolist()
+        expected_rows = len(pd.read_csv(expected_balance_sheet_path, usecols=[0]))
         
         # モック: 同じ形式の出力を生成
-        mock_generated_data = pd.DataFrame({
-            col: [0] * len(expected_df) for col in expected_columns
-        })
+        mock_generated_data = pd.DataFrame(0, index=range(expected_rows), columns=expected_columns)
         
         with patch.object(processor, 'generate_balance_sheet_format') as mock_gen:
             mock_gen.return_value = mock_generated_data
@@ -293,82 +286,19 @@ class TestMonthEndProcessing:
             finally:
                 os.unlink(f.name)
 
-    def test_subject_code_mapping_coverage(self, processor, temp_financial_csv):
+    def test_subject_code_mapping_coverage(self, loaded_journal):
         """科目コードマッピングの網羅性テスト"""
-        original_to_sql = pd.DataFrame.to_sql
-        captured_df = None
-        
-        def capture_df(self, *args, **kwargs):
-            nonlocal captured_df
-            captured_df = self.copy()
-            return original_to_sql(self, *args, **kwargs)
-        
-        with patch('pandas.DataFrame.to_sql', capture_df):
-            with patch('pandas.read_sql') as mock_read_sql:
-                mock_read_sql.return_value = pd.DataFrame({'count': [0]})
-                with patch.object(processor.db, 'get_connection') as mock_get_conn:
-                    # connectionオブジェクトのモック設定
-                    mock_conn = mock_get_conn.return_value.__enter__.return_value
-                    mock_result = mock_conn.execute.return_value
-                    mock_result.rowcount = 0  # rowcountを整数値に設定
-                    processor.process_csv_for_database(temp_financial_csv)
-        
-        assert captured_df is not None
+        assert len(loaded_journal) > 0
         
         # 科目コードマッピングの確認
-        mapped_subjects = captured_df[captured_df['subject'].notna()]
-        unmapped_subjects = captured_df[captured_df['subject'].isna()]
+        mapped_subjects = loaded_journal[loaded_journal['subject'].notna()]
+        unmapped_subjects = loaded_journal[loaded_journal['subject'].isna()]
         
         # 大部分の科目コードがマッピングされていることを確認
-        mapping_ratio = len(mapped_subjects) / len(captured_df)
+        mapping_ratio = len(mapped_subjects) / len(loaded_journal)
         assert mapping_ratio > 0.8  # 80%以上がマッピングされていることを期待
         
         # 未マッピングの科目コードがある場合は警告
         if len(unmapped_subjects) > 0:
             unique_unmapped_codes = unmapped_subjects['subject_code'].unique()
             print(f"Warning: Unmapped subject codes: {unique_unmapped_codes}")
-
-
-# CSVProcessorクラスに月末処理メソッドを追加するためのパッチ
-def patch_csv_processor_with_month_end_methods():
-    """CSVProcessorクラスに月末処理メソッドを追加"""
-    
-    def get_monthly_balance_summary(self) -> pd.DataFrame:
-        """月次残高集計の取得"""
-        query = """
-        SELECT 
-            CONCAT(year, '-', LPAD(month::text, 2, '0')) as YearMonth,
-            SUM(CASE WHEN subject_code = 100 THEN amount ELSE 0 END) as "100",
-            SUM(CASE WHEN subject_code = 101 THEN amount ELSE 0 END) as "101",
-            SUM(CASE WHEN subject_code = 102 THEN amount ELSE 0 END) as "102",
-            SUM(CASE WHEN subject_code = 200 THEN amount ELSE 0 END) as "200",
-            SUM(CASE WHEN subject_code = 500 THEN amount ELSE 0 END) as "500",
-            SUM(CASE WHEN subject_code = 530 THEN amount ELSE 0 END) as "530",
-            SUM(CASE WHEN subject_code BETWEEN 100 AND 199 THEN amount ELSE 0 END) as TotalAssets,
-            SUM(CASE WHEN subject_code BETWEEN 200 AND 299 THEN amount ELSE 0 END) as TotalLiabilities,
-            SUM(CASE WHEN subject_code BETWEEN 400 AND 499 THEN amount ELSE 0 END) as TotalIncome,
-            SUM(CASE WHEN subject_code BETWEEN 500 AND 599 THEN amount ELSE 0 END) as TotalExpenses
-        FROM journal_entries 
-        GROUP BY year, month
-        ORDER BY year, month
-        """
-        with self.db.get_connection() as conn:
-            return pd.read_sql(query, conn)
-    
-    def generate_balance_sheet_format(self) -> pd.DataFrame:
-        """financial_balance_sheet.csv形式の出力生成"""
-        monthly_data = self.get_monthly_balance_summary()
-        
-        # NetIncomeとTotalEquityの計算
-        monthly_data['NetIncome'] = monthly_data['TotalIncome'] + monthly_data['TotalExpenses']
-        monthly_data['TotalEquity'] = monthly_data['TotalAssets'] - monthly_data['TotalLiabilities']
-        
-        return monthly_data
-    
-    # メソッドを動的に追加
-    CSVProcessor.get_monthly_balance_summary = get_monthly_balance_summary
-    CSVProcessor.generate_balance_sheet_format = generate_balance_sheet_format
-
-
-# テスト実行前にメソッドを追加
-patch_csv_processor_with_month_end_methods()
\ No newline at end of file